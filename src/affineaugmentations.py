@@ -0,0 +1,117 @@
+import random
+import cv2
+import numpy as np
+
+'''
+This class expresses the geometric augmentations (resize, crop, rotate and flip) as affine matrices, so that a run
+of them is composed into one matrix and the image is resampled by a single cv2.warpAffine instead of once per
+augmentation. Boxes are carried through the same matrix by transforming their corners.
+Matrices are 3x3 and work on continuous coordinates where pixel (i, j) covers [i, i + 1) x [j, j + 1), the
+convention of the box coordinates. Random values are drawn in the same order as by the single augmentations.
+'''
+
+
+class AffineAugmentations:
+
+    @staticmethod
+    def scale(x: float, y: float) -> np.ndarray:
+        return np.array([[x, 0, 0], [0, y, 0], [0, 0, 1]], dtype=np.float64)
+
+    @staticmethod
+    def translate(x: float, y: float) -> np.ndarray:
+        return np.array([[1, 0, x], [0, 1, y], [0, 0, 1]], dtype=np.float64)
+
+    # every matrix function takes the current image size and returns the matrix, or None if the augmentation is
+    # skipped, and the image size after the augmentation
+
+    @staticmethod
+    def resize(size: tuple, args: dict) -> tuple:
+        width, height = size
+        return AffineAugmentations.scale(args['width'] / width, args['height'] / height), (args['width'], args['height'])
+
+    @staticmethod
+    def crop(size: tuple, args: dict) -> tuple:
+        if random.uniform(0, 1) > args['prob']:
+            return None, size
+        width, height = size
+        factor = random.uniform(args['min_crop'], 1)
+        crop_width = int(width * factor)
+        crop_height = int(height * factor)
+        x0 = random.randint(0, width - crop_width)
+        y0 = random.randint(0, height - crop_height)
+        # the cropped region is scaled back to the full image size
+        return AffineAugmentations.scale(width / crop_width, height / crop_height) @ AffineAugmentations.translate(-x0, -y0), size
+
+    @staticmethod
+    def rotate(size: tuple, args: dict) -> tuple:
+        if random.uniform(0, 1) > args['prob']:
+            return None, size
+        width, height = size
+        matrix = cv2.getRotationMatrix2D(center=(width / 2, height / 2),
+                                         angle=random.uniform(args['min_degree'], args['max_degree']), scale=1)
+        return np.vstack([matrix, [0, 0, 1]]), size
+
+    @staticmethod
+    def flip(size: tuple, args: dict) -> tuple:
+        if random.uniform(0, 1) > args['prob']:
+            return None, size
+        width, height = size
+        if args['type'] == 0:
+            return np.array([[1, 0, 0], [0, -1, height], [0, 0, 1]], dtype=np.float64), size
+        return np.array([[-1, 0, width], [0, 1, 0], [0, 0, 1]], dtype=np.float64), size
+
+    @staticmethod
+    def compose(size: tuple, steps: list) -> tuple:
+        # returns the combined matrix, the output size and whether pixels from outside the image can show up
+        matrix = np.eye(3)
+        rotated = False
+        for transform, args in steps:
+            step_matrix, size = transform(size, args)
+            if step_matrix is None:
+                continue
+            matrix = step_matrix @ matrix
+            rotated = rotated or transform is AffineAugmentations.rotate
+        return matrix, size, rotated
+
+    @staticmethod
+    def warp(image: np.ndarray, matrix: np.ndarray, size: tuple, rotated: bool) -> np.ndarray:
+        # warpAffine maps pixel centers, which sit half a pixel off the continuous coordinates
+        pixel_matrix = AffineAugmentations.translate(-0.5, -0.5) @ matrix @ AffineAugmentations.translate(0.5, 0.5)
+        # rotations fill the uncovered corners black like before, otherwise the image edges are extended like
+        # cv2.resize does
+        return cv2.warpAffine(image, pixel_matrix[:2], size, flags=cv2.INTER_LINEAR,
+                              borderMode=cv2.BORDER_CONSTANT if rotated else cv2.BORDER_REPLICATE)
+
+    @staticmethod
+    def warp_boxes(boxes: list, matrix: np.ndarray, size: tuple) -> list:
+        # the new box encloses the transformed corners of the old one and is clipped to the image, boxes that end
+        # up outside of the image become empty
+        width, height = size
+        warped = []
+        for box in boxes:
+            corners = np.array([[box['x0'], box['x0'], box['x1'], box['x1']],
+                                [box['y0'], box['y1'], box['y0'], box['y1']],
+                                [1, 1, 1, 1]], dtype=np.float64)
+            xs, ys, _ = matrix @ corners
+            warped.append({
+                'x0': int(round(min(max(xs.min(), 0), width))),
+                'y0': int(round(min(max(ys.min(), 0), height))),
+                'x1': int(round(min(max(xs.max(), 0), width))),
+                'y1': int(round(min(max(ys.max(), 0), height)))
+            })
+        return warped
+
+    @staticmethod
+    def apply(image: np.ndarray, args: dict) -> np.ndarray:
+        image, _ = AffineAugmentations.apply_with_boxes(image, [], args)
+        return image
+
+    @staticmethod
+    def apply_with_boxes(image: np.ndarray, boxes: list, args: dict) -> tuple:
+        # args['steps'] holds (matrix function, parsed arguments) for every composed augmentation
+        original_size = (image.shape[1], image.shape[0])
+        matrix, size, rotated = AffineAugmentations.compose(original_size, args['steps'])
+        if size == original_size and np.array_equal(matrix, np.eye(3)):
+            # none of the augmentations fired
+            return image, boxes
+        return AffineAugmentations.warp(image, matrix, size, rotated), AffineAugmentations.warp_boxes(boxes, matrix, size)
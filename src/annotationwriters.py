@@ -1,19 +1,61 @@
+import heapq
 import os
-from pascal_voc_writer import Writer
 import json
+import threading
+import time
 
-ACCEPTED_ANNOTATION_FORMATS = ['xml', 'json']
+ACCEPTED_ANNOTATION_FORMATS = ['xml', 'json', 'yolo', 'coco', 'jsonl']
+# formats that collect the annotations of all images in one file instead of writing one file per image
+STREAMED_ANNOTATION_FORMATS = ['coco', 'jsonl']
+ANNOTATION_EXTENSIONS = {'xml': 'xml', 'json': 'json', 'yolo': 'txt', 'coco': 'json', 'jsonl': 'jsonl'}
 
+RECORDS_FILE = 'annotations.jsonl'
+COCO_FILE = 'annotations.json'
+CLASSES_FILE = 'classes.txt'
 
-def write_xml(image_path, image_width, image_height, labels, boxes, annotation_dir):
-    writer = Writer(image_path, image_width, image_height)
-    for label, box in zip(labels, boxes):
-        writer.addObject(str(label), box['x0'], box['y0'], box['x1'], box['y1'])
+
+def annotation_name(image_path: str, annotation_format: str) -> str:
     image_name = os.path.basename(image_path)
-    writer.save(os.path.join(annotation_dir, image_name[0:image_name.index(".")] + ".xml"))
+    return image_name[0:image_name.index(".")] + "." + ANNOTATION_EXTENSIONS[annotation_format.lower()]
 
 
-def write_json(image_path, image_width, image_height, labels, boxes, annotation_dir):
+def render_xml(image_path, image_width, image_height, labels, boxes) -> str:
+    # builds the same document as the template of pascal_voc_writer without going through a template engine
+    path = os.path.abspath(image_path)
+    parts = [
+        '<annotation>\n'
+        f'    <folder>{os.path.basename(os.path.dirname(path))}</folder>\n'
+        f'    <filename>{os.path.basename(path)}</filename>\n'
+        f'    <path>{path}</path>\n'
+        '    <source>\n'
+        '        <database>Unknown</database>\n'
+        '    </source>\n'
+        '    <size>\n'
+        f'        <width>{image_width}</width>\n'
+        f'        <height>{image_height}</height>\n'
+        '        <depth>3</depth>\n'
+        '    </size>\n'
+        '    <segmented>0</segmented>\n'
+    ]
+    for label, box in zip(labels, boxes):
+        parts.append(
+            '    <object>\n'
+            f'        <name>{label}</name>\n'
+            '        <pose>Unspecified</pose>\n'
+            '        <truncated>0</truncated>\n'
+            '        <difficult>0</difficult>\n'
+            '        <bndbox>\n'
+            f'            <xmin>{box["x0"]}</xmin>\n'
+            f'            <ymin>{box["y0"]}</ymin>\n'
+            f'            <xmax>{box["x1"]}</xmax>\n'
+            f'            <ymax>{box["y1"]}</ymax>\n'
+            '        </bndbox>\n'
+            '    </object>')
+    parts.append('\n</annotation>\n')
+    return ''.join(parts)
+
+
+def render_json(image_path, image_width, image_height, labels, boxes) -> str:
     image_name = os.path.basename(image_path)
     annotation_dict = {
         'image_name': image_name,
@@ -22,13 +64,112 @@ def write_json(image_path, image_width, image_height, labels, boxes, annotation_
         'labels': labels,
         'boxes': boxes
     }
-    json_object = json.dumps(annotation_dict, indent=4)
-    with open(os.path.join(annotation_dir, image_name[0:image_name.index(".")] + ".json"), "w") as outfile:
-        outfile.write(json_object)
+    return json.dumps(annotation_dict, indent=4)
+
+
+def render_yolo(image_width, image_height, labels, boxes, classes) -> str:
+    # one "class x_center y_center width height" line per object, relative to the image size
+    class_ids = {label: i for i, label in enumerate(classes)}
+    lines = []
+    for label, box in zip(labels, boxes):
+        lines.append(f"{class_ids[label]} {(box['x0'] + box['x1']) / 2 / image_width:.6f} "
+                     f"{(box['y0'] + box['y1']) / 2 / image_height:.6f} {(box['x1'] - box['x0']) / image_width:.6f} "
+                     f"{(box['y1'] - box['y0']) / image_height:.6f}\n")
+    return ''.join(lines)
+
+
+def render_record(image_path, image_width, image_height, labels, boxes, index) -> str:
+    # a single line record of one image, as collected by the streamed formats
+    return json.dumps({
+        'index': index,
+        'image_name': os.path.basename(image_path),
+        'image_width': image_width,
+        'image_height': image_height,
+        'labels': labels,
+        'boxes': boxes
+    }, separators=(',', ':'))
+
+
+def write_xml(image_path, image_width, image_height, labels, boxes, annotation_dir):
+    with open(os.path.join(annotation_dir, annotation_name(image_path, 'xml')), "w") as outfile:
+        outfile.write(render_xml(image_path, image_width, image_height, labels, boxes))
+
+
+def write_json(image_path, image_width, image_height, labels, boxes, annotation_dir):
+    with open(os.path.join(annotation_dir, annotation_name(image_path, 'json')), "w") as outfile:
+        outfile.write(render_json(image_path, image_width, image_height, labels, boxes))
+
+
+def write_yolo(image_path, image_width, image_height, labels, boxes, classes, annotation_dir):
+    with open(os.path.join(annotation_dir, annotation_name(image_path, 'yolo')), "w") as outfile:
+        outfile.write(render_yolo(image_width, image_height, labels, boxes, classes))
+
+
+def write_record(image_path, image_width, image_height, labels, boxes, index, annotation_dir):
+    # records are appended to the records file, write_coco turns them into a COCO file
+    with open(os.path.join(annotation_dir, RECORDS_FILE), "a") as outfile:
+        outfile.write(render_record(image_path, image_width, image_height, labels, boxes, index) + '\n')
+
+
+def write_classes(classes: list, annotation_dir: str):
+    # YOLO labels refer to classes by their line in this file
+    with open(os.path.join(annotation_dir, CLASSES_FILE), "w") as outfile:
+        outfile.write(''.join(f'{label}\n' for label in classes))
+
+
+def read_records(path: str):
+    with open(path, 'r') as f:
+        for line in f:
+            yield json.loads(line)
+
+
+def write_coco(classes: list, annotation_dir: str):
+    # streams the records file into a COCO file, reading it once for the images and once for the annotations
+    records_path = os.path.join(annotation_dir, RECORDS_FILE)
+    category_ids = {label: i + 1 for i, label in enumerate(classes)}
+    with open(os.path.join(annotation_dir, COCO_FILE), "w") as outfile:
+        outfile.write('{"categories":')
+        outfile.write(json.dumps([{'id': category_ids[label], 'name': label} for label in classes]))
+        outfile.write(',"images":[')
+        for i, record in enumerate(read_records(records_path)):
+            outfile.write((',' if i else '') + json.dumps({
+                'id': record['index'],
+                'file_name': record['image_name'],
+                'width': record['image_width'],
+                'height': record['image_height']
+            }))
+        outfile.write('],"annotations":[')
+        annotation_id = 0
+        for record in read_records(records_path):
+            for label, box in zip(record['labels'], record['boxes']):
+                width, height = box['x1'] - box['x0'], box['y1'] - box['y0']
+                outfile.write((',' if annotation_id else '') + json.dumps({
+                    'id': annotation_id + 1,
+                    'image_id': record['index'],
+                    'category_id': category_ids[label],
+                    'bbox': [box['x0'], box['y0'], width, height],
+                    'area': width * height,
+                    'iscrowd': 0
+                }))
+                annotation_id += 1
+        outfile.write(']}\n')
+
+
+def render_annotations(annotation_format: str, image_path: str, image_width: int, image_height: int, labels: list,
+                       boxes: list, classes: list = None, index: int = None) -> str:
+    match (annotation_format.lower()):
+        case 'xml':
+            return render_xml(image_path, image_width, image_height, labels, boxes)
+        case 'json':
+            return render_json(image_path, image_width, image_height, labels, boxes)
+        case 'yolo':
+            return render_yolo(image_width, image_height, labels, boxes, classes)
+        case 'coco' | 'jsonl':
+            return render_record(image_path, image_width, image_height, labels, boxes, index)
 
 
 def write_annotations(annotation_format: str, image_path: str, image_width: int, image_height: int, labels: str,
-                      boxes: list, annotation_dir: str):
+                      boxes: list, annotation_dir: str, classes: list = None, index: int = None):
     match (annotation_format.lower()):
         case 'xml':
             write_xml(image_path, image_width, image_height, labels, boxes, annotation_dir)
@@ -36,3 +177,137 @@ def write_annotations(annotation_format: str, image_path: str, image_width: int,
         case 'json':
             write_json(image_path, image_width, image_height, labels, boxes, annotation_dir)
             return True
+        case 'yolo':
+            write_yolo(image_path, image_width, image_height, labels, boxes, classes, annotation_dir)
+            return True
+        case 'coco' | 'jsonl':
+            write_record(image_path, image_width, image_height, labels, boxes, index, annotation_dir)
+            return True
+
+
+'''
+This class collects the annotations of the streamed formats (coco, jsonl) of a run in one records file.
+Every writer run, i.e. every chunk of a worker process, streams its records into its own part file, in the order
+the samples were submitted, which is index order. Records finished out of order by the writer threads wait in a
+small buffer, so memory stays bounded by the writer queue. At the end of the run the sorted parts are merged into
+the records file, together with the records of the run that is resumed, later records of an index replacing earlier
+ones. For coco the records file is then streamed into a COCO file.
+'''
+
+
+class AnnotationStream:
+
+    def __init__(self, annotation_dir: str, annotation_format: str, classes: list, records_file: str = RECORDS_FILE):
+        self.annotation_dir = annotation_dir
+        self.annotation_format = annotation_format.lower()
+        self.classes = classes
+        # nodes of a run split across machines collect their records in their own file until they are merged
+        self.records_file = records_file
+        self.part = None
+        self.pending = {}
+        self.next_sequence = 0
+        self.lock = None
+
+    @staticmethod
+    def node_records_file(shard_index: int, num_shards: int) -> str:
+        return RECORDS_FILE if num_shards == 1 else f'annotations.node-{shard_index:05d}-of-{num_shards:05d}.jsonl'
+
+    def records_path(self) -> str:
+        return os.path.join(self.annotation_dir, self.records_file)
+
+    def part_prefix(self) -> str:
+        return self.records_file[0:self.records_file.rindex('.')] + '.part-'
+
+    def part_paths(self) -> list:
+        # part names start with their creation time, so sorting them puts later parts last
+        return sorted(os.path.join(self.annotation_dir, name) for name in os.listdir(self.annotation_dir)
+                      if name.startswith(self.part_prefix()))
+
+    def reset(self):
+        # a new run starts without the records of earlier runs, a node only removes its own ones
+        paths = [self.records_path()] + self.part_paths()
+        if self.records_file == RECORDS_FILE:
+            paths.append(os.path.join(self.annotation_dir, COCO_FILE))
+        for path in paths:
+            if os.path.isfile(path):
+                os.remove(path)
+
+    def open(self):
+        self.lock = threading.Lock()
+        self.pending = {}
+        self.next_sequence = 0
+        self.part = open(os.path.join(self.annotation_dir,
+                                      f'{self.part_prefix()}{time.time_ns():020d}-{os.getpid()}.jsonl'), 'w')
+
+    def add(self, sequence: int, record: str, written=None):
+        # written is called once the record reached the part file, so that a sample is only counted as generated by
+        # the run manifest when its record survives the run being killed
+        with self.lock:
+            self.pending[sequence] = (record, written)
+            flushed = []
+            while self.next_sequence in self.pending:
+                flushed.append(self.pending.pop(self.next_sequence))
+                self.next_sequence += 1
+            self.flush(flushed)
+
+    def flush(self, records: list):
+        if len(records) == 0:
+            return
+        self.part.write(''.join(record + '\n' for record, _ in records))
+        self.part.flush()
+        for _, written in records:
+            if written is not None:
+                written()
+
+    def close(self):
+        # records behind a sample that failed to write are still kept
+        self.flush([self.pending.pop(sequence) for sequence in sorted(self.pending)])
+        self.part.close()
+        self.part = None
+        self.lock = None
+
+    @staticmethod
+    def keyed(path: str, order: int):
+        with open(path, 'r') as f:
+            for line in f:
+                # the last line of a part may be cut off if the run was killed while writing it
+                try:
+                    index = json.loads(line)['index']
+                except json.JSONDecodeError:
+                    continue
+                yield index, order, line if line.endswith('\n') else line + '\n'
+
+    @staticmethod
+    def merge_records(sources: list, target: str):
+        # sources are sorted by index, of several records of an index the one from the latest source is written
+        with open(target + '.tmp', 'w') as outfile:
+            previous = None
+            for index, _, line in heapq.merge(*[AnnotationStream.keyed(path, order) for order, path in enumerate(sources)]):
+                if previous is not None and previous[0] != index:
+                    outfile.write(previous[1])
+                previous = (index, line)
+            if previous is not None:
+                outfile.write(previous[1])
+        os.replace(target + '.tmp', target)
+
+    def finish(self):
+        parts = self.part_paths()
+        AnnotationStream.merge_records(([self.records_path()] if os.path.isfile(self.records_path()) else []) + parts,
+                                       self.records_path())
+        for path in parts:
+            os.remove(path)
+        # the COCO file of a split run is only written once the records of all nodes are merged
+        if self.annotation_format == 'coco' and self.records_file == RECORDS_FILE:
+            write_coco(self.classes, self.annotation_dir)
+
+    def merge_nodes(self, num_shards: int):
+        nodes = [os.path.join(self.annotation_dir, AnnotationStream.node_records_file(i, num_shards))
+                 for i in range(num_shards)]
+        merged = os.path.join(self.annotation_dir, RECORDS_FILE)
+        AnnotationStream.merge_records(nodes, merged)
+        for path in nodes:
+            # never remove the merged records themselves
+            if path != merged:
+                os.remove(path)
+        if self.annotation_format == 'coco':
+            write_coco(self.classes, self.annotation_dir)
@@ -1,4 +1,9 @@
 from augmentations import Augmentations, BoxAugmentations
+from affineaugmentations import AffineAugmentations
+from batchaugmentations import BatchAugmentations
+from generatorexception import InvalidGeneratorArgumentException
+from instrumentation import NULL_STAGE
+import augmentplan
 import configparser
 import numpy as np
 
@@ -18,16 +23,145 @@ CLASSIFICATION_AUGMENTS = {
 
 DETECTION_AUGMENTS = {
     "resize": BoxAugmentations.resize,
+    "crop": BoxAugmentations.crop,
     "flip": BoxAugmentations.flip,
+    "rotate": BoxAugmentations.rotate,
     "random_object_erase": BoxAugmentations.random_object_erase
 }
 
-def apply(image: np.ndarray, augment_config: configparser.ConfigParser, boxes: list = None): # type: ignore
-    for section in augment_config.sections():
+# augmentations that can also be applied to a whole stack of same-size images at once
+BATCH_AUGMENTS = {
+    "flip": BatchAugmentations.flip,
+    "random_erase": BatchAugmentations.random_erase,
+    "gauss_noise": BatchAugmentations.gauss_noise,
+    "hsv_shift": BatchAugmentations.hsv_shift,
+    "color_jitter": BatchAugmentations.color_jitter
+}
+
+# augmentations backed by albumentations get their transform built once instead of on every image, which is also
+# the first time albumentations is imported
+AUGMENT_BUILDERS = {
+    "hsv_shift": Augmentations.build_hsv_shift,
+    "gauss_noise": Augmentations.build_gauss_noise,
+    "color_jitter": Augmentations.build_color_jitter
+}
+
+
+'''
+A compiled augmentation pipeline holds one step per augmentation section of the config, in config order.
+Every step is the augmentation function together with its already parsed arguments, so applying the pipeline
+to an image only does the image manipulations.
+'''
+
+
+class AugmentPipeline:
+
+    def __init__(self, steps: list):
+        self.steps = steps
+        # set by the generator to time every augmentation section
+        self.metrics = None
+
+    def __call__(self, image: np.ndarray, boxes: list = None) -> tuple:
+        for section, augment, args, moves_boxes, _ in self.steps:
+            if self.metrics is None:
+                image, boxes = AugmentPipeline.apply_step(augment, args, moves_boxes, image, boxes)
+                continue
+            with self.metrics.stage('augment.' + section):
+                image, boxes = AugmentPipeline.apply_step(augment, args, moves_boxes, image, boxes)
+        return image, boxes
+
+    def stage(self, section: str):
+        return self.metrics.stage('augment.' + section) if self.metrics is not None else NULL_STAGE
+
+    @staticmethod
+    def apply_step(augment, args: dict, moves_boxes: bool, image: np.ndarray, boxes: list) -> tuple:
+        if moves_boxes:
+            return augment(image, boxes, args)
+        return augment(image, args), boxes
+
+    def apply_batch(self, images: list, boxes: list = None) -> tuple:
+        # steps with a batch version run on the stacked images as long as all images have the same size,
+        # all other steps run image by image
+        stack = None
+        box_stack, box_counts = None, None
+        for section, augment, args, moves_boxes, batch_augment in self.steps:
+            if batch_augment is not None and (stack is not None or len({image.shape for image in images}) == 1):
+                if stack is None:
+                    stack = np.stack(images)
+                    if boxes is not None:
+                        box_stack, box_counts = BatchAugmentations.stack_boxes(boxes)
+                with self.stage(section):
+                    stack, box_stack = batch_augment(stack, box_stack, args)
+                continue
+            if stack is not None:
+                images = list(stack)
+                if boxes is not None:
+                    boxes = BatchAugmentations.unstack_boxes(box_stack, box_counts)
+                stack = None
+            with self.stage(section):
+                for i in range(len(images)):
+                    images[i], image_boxes = AugmentPipeline.apply_step(augment, args, moves_boxes, images[i],
+                                                                       boxes[i] if boxes is not None else None)
+                    if boxes is not None:
+                        boxes[i] = image_boxes
+        if stack is not None:
+            images = list(stack)
+            if boxes is not None:
+                boxes = BatchAugmentations.unstack_boxes(box_stack, box_counts)
+        return images, boxes
+
+    def sections(self) -> list:
+        return [step[0] for step in self.steps]
+
+    def input_size(self) -> tuple:
+        # (width, height) every image is resized to by the first step, None if the pipeline does not start with
+        # a resize
+        if len(self.steps) == 0:
+            return None
+        section, _, args, _, _ = self.steps[0]
+        if section == 'resize':
+            return args['width'], args['height']
+        if section.startswith('resize+'):
+            return args['steps'][0][1]['width'], args['steps'][0][1]['height']
+        return None
+
+
+def build_args(section: str, args: dict) -> dict:
+    if section in AUGMENT_BUILDERS:
+        try:
+            args['transform'] = AUGMENT_BUILDERS[section](args)
+        except ValueError as exc:
+            raise InvalidGeneratorArgumentException(f"Invalid arguments in augmentation section [{section}]: {exc}")
+    return args
+
+
+def parse_args(section: str, raw_args: dict) -> dict:
+    return build_args(section, augmentplan.parse_args(section, raw_args))
+
+
+def fuse_affine(steps: list, with_boxes: bool) -> list:
+    # runs of consecutive geometric augmentations become one step that resamples the image only once
+    fused = []
+    for run in augmentplan.affine_runs([step[0] for step in steps]):
+        if len(run) == 1:
+            fused.append(steps[run[0]])
+            continue
+        fused_args = {'steps': [(getattr(AffineAugmentations, steps[i][0]), steps[i][2]) for i in run]}
+        fused.append(('+'.join(steps[i][0] for i in run),
+                      AffineAugmentations.apply_with_boxes if with_boxes else AffineAugmentations.apply,
+                      fused_args, with_boxes, None))
+    return fused
+
+
+def compile(augment_config: configparser.ConfigParser, with_boxes: bool = False) -> AugmentPipeline:
+    steps = []
+    for section, args in augmentplan.plan(augment_config, with_boxes):
+        # general augmentations do not move pixels, so boxes are passed through them unchanged
         if section in GENERAL_AUGMENTS:
-            image = GENERAL_AUGMENTS[section](image, dict(augment_config.items(section)))
-        elif section in CLASSIFICATION_AUGMENTS and boxes is None:
-            image = CLASSIFICATION_AUGMENTS[section](image, dict(augment_config.items(section)))
-        elif section in DETECTION_AUGMENTS and boxes is not None:
-            image, boxes = DETECTION_AUGMENTS[section](image, boxes, dict(augment_config.items(section)))
-    return image, boxes
+            augment, moves_boxes = GENERAL_AUGMENTS[section], False
+        elif with_boxes:
+            augment, moves_boxes = DETECTION_AUGMENTS[section], True
+        else:
+            augment, moves_boxes = CLASSIFICATION_AUGMENTS[section], False
+        steps.append((section, augment, build_args(section, args), moves_boxes, BATCH_AUGMENTS.get(section)))
+    return AugmentPipeline(fuse_affine(steps, with_boxes))
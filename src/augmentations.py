@@ -2,21 +2,24 @@ import numpy
 import cv2
 import random
 import numpy as np
-import albumentations as A
+from affineaugmentations import AffineAugmentations
+from placement import PlacementEngine
+from spritepyramid import SpritePyramid
+
 
 class Augmentations:
 
     @staticmethod
     def resize(image: numpy.ndarray, args: dict) -> numpy.ndarray:
-        return cv2.resize(image, (int(args['width']), int(args['height'])), interpolation=cv2.INTER_LINEAR)
+        return cv2.resize(image, (args['width'], args['height']), interpolation=cv2.INTER_LINEAR)
 
     @staticmethod
     def random_erase(image: numpy.ndarray, args: dict) -> numpy.ndarray:
-        if random.uniform(0, 1) <= float(args['prob']):
+        if random.uniform(0, 1) <= args['prob']:
             max_width = image[0].__len__()
             max_height = image.__len__()
-            crop_width = random.randint(0, int(max_width * float(args['max_erase'])))
-            crop_height = random.randint(0, int(max_height * float(args['max_erase'])))
+            crop_width = random.randint(0, int(max_width * args['max_erase']))
+            crop_height = random.randint(0, int(max_height * args['max_erase']))
             crop_x0 = random.randint(0, max_width - crop_width)
             crop_y0 = random.randint(0, max_height - crop_height)
             crop_x1 = crop_x0 + crop_width
@@ -28,8 +31,8 @@ class Augmentations:
 
     @staticmethod
     def flip(image: numpy.ndarray, args: dict) -> numpy.ndarray:
-        if random.uniform(0, 1) <= float(args['prob']):
-            if int(args['type']) == 0:
+        if random.uniform(0, 1) <= args['prob']:
+            if args['type'] == 0:
                 return cv2.flip(image, 0)
             else:
                 return cv2.flip(image, 1)
@@ -37,10 +40,10 @@ class Augmentations:
 
     @staticmethod
     def crop(image: numpy.ndarray, args: dict) -> numpy.ndarray:
-        if random.uniform(0, 1) <= float(args['prob']):
+        if random.uniform(0, 1) <= args['prob']:
             width = image[0].__len__()
             height = image.__len__()
-            factor = random.uniform(float(args['min_crop']), 1)
+            factor = random.uniform(args['min_crop'], 1)
             crop_width = int(width * factor)
             crop_height = int(height * factor)
             x0 = random.randint(0, width - crop_width)
@@ -51,54 +54,60 @@ class Augmentations:
 
     @staticmethod
     def rotate(image: np.ndarray, args: dict) -> np.ndarray:
-        if random.uniform(0, 1) <= float(args['prob']):
+        if random.uniform(0, 1) <= args['prob']:
             height, width = image.shape[:2]
             center = (width / 2, height / 2)
-            rotate_matrix = cv2.getRotationMatrix2D(center=center, angle=random.uniform(float(args['min_degree']), float(args['max_degree'])), scale=1)
+            rotate_matrix = cv2.getRotationMatrix2D(center=center, angle=random.uniform(args['min_degree'], args['max_degree']), scale=1)
             image = cv2.warpAffine(src=image, M=rotate_matrix, dsize=(width, height))
         return image
 
     @staticmethod
-    def color_jitter(image: np.ndarray, args: dict) -> np.ndarray:
-        brighness = random.uniform(0, float(args['brightness']))
-        contrast = random.uniform(0, float(args['contrast']))
-        hue = random.uniform(0, float(args['hue']))
-        saturation = random.uniform(0, float(args['saturation']))
-        transforms = A.Compose([
-            A.augmentations.transforms.ColorJitter(brightness=brighness,
-                                                            contrast=contrast,
-                                                            hue=hue,
-                                                            saturation=saturation,
-                                                            p=float(args['prob']))
+    def build_color_jitter(args: dict):
+        # albumentations takes seconds to import, so it is only loaded by pipelines that use one of its transforms
+        import albumentations as A
+        return A.Compose([
+            A.augmentations.transforms.ColorJitter(brightness=args['brightness'],
+                                                            contrast=args['contrast'],
+                                                            hue=args['hue'],
+                                                            saturation=args['saturation'],
+                                                            p=args['prob'])
         ])
-        image = transforms(image=image)['image']
+
+    @staticmethod
+    def color_jitter(image: np.ndarray, args: dict) -> np.ndarray:
+        image = args['transform'](image=image)['image']
         #image = cv2.cvtColor(image, cv2.COLOR_RGB2BGR)
         return image    
-    
+
     @staticmethod
-    def hsv_shift(image: np.ndarray, args: dict) -> np.ndarray:
-        transforms = A.Compose([
-            A.augmentations.transforms.HueSaturationValue(hue_shift_limit=int(args['hue']),
-                                                            sat_shift_limit=int(args['saturation']),
-                                                            val_shift_limit=int(args['value']),
-                                                            p=float(args['prob']))
+    def build_hsv_shift(args: dict):
+        import albumentations as A
+        return A.Compose([
+            A.augmentations.transforms.HueSaturationValue(hue_shift_limit=args['hue'],
+                                                            sat_shift_limit=args['saturation'],
+                                                            val_shift_limit=args['value'],
+                                                            p=args['prob'])
         ])
-        image = transforms(image=image)['image']
+
+    @staticmethod
+    def hsv_shift(image: np.ndarray, args: dict) -> np.ndarray:
+        image = args['transform'](image=image)['image']
         #image = cv2.cvtColor(image, cv2.COLOR_RGB2BGR)
         return image    
 
     @staticmethod
-    def gauss_noise(image: np.ndarray, args: dict) -> np.ndarray:
-        print(image[100][100][0], image[100][100][1], image[100][100][2])
-        transforms = A.Compose([
-            A.GaussNoise(var_limit=int(args['variance']),
-                        mean=int(args['mean']),
-                        p=float(args['prob']))
+    def build_gauss_noise(args: dict):
+        import albumentations as A
+        return A.Compose([
+            A.GaussNoise(var_limit=args['variance'],
+                        mean=args['mean'],
+                        p=args['prob'])
         ])
-        print(image[100][100][0], image[100][100][1], image[100][100][2])
+
+    @staticmethod
+    def gauss_noise(image: np.ndarray, args: dict) -> np.ndarray:
         image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
-        print(image[100][100][0], image[100][100][1], image[100][100][2])
-        return transforms(image=image)['image']
+        return args['transform'](image=image)['image']
 
 
 
@@ -112,9 +121,9 @@ class BoxAugmentations:
 
     @staticmethod
     def resize(image: np.ndarray, boxes: list, args: dict) -> tuple:
-        aug_image = cv2.resize(image, (int(args['width']), int(args['height'])), interpolation=cv2.INTER_LINEAR)
-        factor_x = int(args['width']) / image[0].__len__()
-        factor_y = int(args['height']) / image.__len__()
+        aug_image = cv2.resize(image, (args['width'], args['height']), interpolation=cv2.INTER_LINEAR)
+        factor_x = args['width'] / image[0].__len__()
+        factor_y = args['height'] / image.__len__()
         aug_boxes = []
         for box in boxes:
             aug_boxes.append({
@@ -125,14 +134,12 @@ class BoxAugmentations:
             })
         return aug_image, aug_boxes
 
-    @staticmethod #only used by overlay to vary object sizes
-    def random_object_resize(image: np.ndarray, obj: np.ndarray) -> np.ndarray: 
-        object_width = obj[0].__len__()
-        object_height = obj.__len__()
+    @staticmethod
+    def random_object_size(image: np.ndarray, object_width: int, object_height: int) -> tuple:
         background_width = image[0].__len__()
         background_height = image.__len__()
-        min_object_width = int(min([background_width, background_height]) / 12)
-        max_object_width = int(min([background_width, background_height]) / 4)
+        min_object_width = max(1, int(min([background_width, background_height]) / 12))
+        max_object_width = max(1, int(min([background_width, background_height]) / 4))
         random_width = random.randint(min_object_width, max_object_width)
         factor = random_width / max([object_width, object_height])
         if object_width >= object_height:
@@ -141,21 +148,57 @@ class BoxAugmentations:
         else:
             new_object_height = random_width
             new_object_width = object_width * factor
-        return cv2.resize(obj, (int(new_object_width), int(new_object_height)))
-
-    @staticmethod
-    def overlay_object(image: np.ndarray, obj: np.ndarray) -> tuple:
-        obj = BoxAugmentations.random_object_resize(image, obj)
-        max_width = image[0].__len__() - obj[0].__len__()
-        max_height = image.__len__() - obj.__len__()
-        start_width = random.randint(0, max_width)
-        start_height = random.randint(0, max_height)
-        for i in range(obj.__len__()):
-            for j in range(obj[0].__len__()):
-                if obj[i][j][3] != 0:
-                    image[start_height + i][start_width + j][0] = obj[i][j][0]
-                    image[start_height + i][start_width + j][1] = obj[i][j][1]
-                    image[start_height + i][start_width + j][2] = obj[i][j][2]
+        return max(1, int(new_object_width)), max(1, int(new_object_height))
+
+    @staticmethod #only used by overlay to vary object sizes
+    def random_object_resize(image: np.ndarray, obj) -> np.ndarray:
+        # sprite pyramids resize their closest level instead of the full sprite
+        size = BoxAugmentations.random_object_size(image, obj.shape[1], obj.shape[0])
+        if isinstance(obj, SpritePyramid):
+            return obj.resize(*size)
+        return cv2.resize(obj, size)
+
+    @staticmethod
+    def fit_object(image: np.ndarray, obj: np.ndarray) -> np.ndarray:
+        # objects larger than the background are scaled down to fit onto it
+        factor = min(image.shape[1] / obj.shape[1], image.shape[0] / obj.shape[0])
+        if factor >= 1:
+            return obj
+        return cv2.resize(obj, (max(1, int(obj.shape[1] * factor)), max(1, int(obj.shape[0] * factor))))
+
+    @staticmethod
+    def blend_object(image: np.ndarray, obj: np.ndarray, x: int, y: int, mode: str = 'mask', feather: int = 0) -> np.ndarray:
+        # composites the whole sprite at once instead of looping over its pixels
+        height, width = obj.shape[:2]
+        region = image[y:y + height, x:x + width]
+        alpha = obj[:, :, 3]
+        if mode == 'mask' and feather == 0:
+            # hard mask: every pixel with non-zero alpha replaces the background pixel
+            np.copyto(region, obj[:, :, :3], where=(alpha != 0)[:, :, None])
+            return image
+        if mode == 'mask':
+            alpha = np.where(alpha != 0, 255, 0).astype(np.uint8)
+        if feather > 0:
+            # soften the mask edges so the sprite fades into the background, outside the sprite counts as transparent
+            # so that edges at the sprite bounds, like those of cropped sprites, are softened too
+            alpha = cv2.GaussianBlur(alpha, (2 * feather + 1, 2 * feather + 1), 0, borderType=cv2.BORDER_CONSTANT)
+        weight = alpha.astype(np.uint16)[:, :, None]
+        blended = (obj[:, :, :3].astype(np.uint16) * weight + region.astype(np.uint16) * (255 - weight) + 127) // 255
+        region[...] = blended.astype(np.uint8)
+        return image
+
+    @staticmethod
+    def overlay_object(image: np.ndarray, obj: np.ndarray, mode: str = 'mask', feather: int = 0,
+                       placement: PlacementEngine = None) -> tuple:
+        # returns None instead of a box if the placement found no valid position for the object
+        obj = BoxAugmentations.fit_object(image, BoxAugmentations.random_object_resize(image, obj))
+        if placement is None:
+            placement = PlacementEngine(image[0].__len__(), image.__len__())
+        position = placement.place(obj[0].__len__(), obj.__len__())
+        if position is None:
+            return image, None
+        start_width, start_height = position
+        image = BoxAugmentations.blend_object(image, obj, start_width, start_height, mode, feather)
         box = {
             'x0': start_width,
             'y0': start_height,
@@ -164,18 +207,38 @@ class BoxAugmentations:
         }
         return image, box
 
+    @staticmethod
+    def overlay_objects(image: np.ndarray, objects: list, mode: str = 'mask', feather: int = 0,
+                        placement: PlacementEngine = None) -> tuple:
+        # pastes all objects for one background, later objects are drawn on top of earlier ones
+        if placement is None:
+            placement = PlacementEngine(image[0].__len__(), image.__len__())
+        boxes = []
+        for obj in objects:
+            image, box = BoxAugmentations.overlay_object(image, obj, mode, feather, placement)
+            boxes.append(box)
+        return image, boxes
+
+    @staticmethod
+    def rotate(image: np.ndarray, boxes: list, args: dict) -> tuple:
+        return AffineAugmentations.apply_with_boxes(image, boxes, {'steps': [(AffineAugmentations.rotate, args)]})
+
+    @staticmethod
+    def crop(image: np.ndarray, boxes: list, args: dict) -> tuple:
+        return AffineAugmentations.apply_with_boxes(image, boxes, {'steps': [(AffineAugmentations.crop, args)]})
+
     @staticmethod
     def random_object_erase(image: np.ndarray, boxes: list, args: dict) -> tuple:
         for box in boxes:
             image[box['y0']:box['y1'], box['x0']:box['x1']] = Augmentations.random_erase(image[box['y0']:box['y1'],
-                                                                                                        box['x0']:box['x1']], args['max_erase']) 
+                                                                                                        box['x0']:box['x1']], args)
         return image, boxes
 
     @staticmethod
     def flip(image: np.ndarray, boxes: list, args:dict) -> tuple:
-        if random.uniform(0, 1) <= float(args['prob']):
+        if random.uniform(0, 1) <= args['prob']:
             flipped_boxes = []
-            if int(args['type']) == 0:
+            if args['type'] == 0:
                 image = cv2.flip(image, 0)
                 height = image.__len__()
                 for box in boxes:
@@ -0,0 +1,67 @@
+from generatorexception import InvalidGeneratorArgumentException
+import configparser
+
+'''
+This module knows which augmentation sections exist and how their arguments are parsed, without importing any of
+the image libraries the augmentations run on. augmentapplier compiles its pipelines from these plans, and a dry run
+of generate.py reports them without loading the augmentation backends.
+'''
+
+GENERAL_SECTIONS = ['hsv_shift', 'gauss_noise', 'color_jitter']
+CLASSIFICATION_SECTIONS = ['resize', 'crop', 'flip', 'rotate', 'random_erase']
+DETECTION_SECTIONS = ['resize', 'crop', 'flip', 'rotate', 'random_object_erase']
+
+# geometric augmentations, consecutive ones are fused into a single resampling of the image
+AFFINE_SECTIONS = ['resize', 'crop', 'rotate', 'flip']
+
+# arguments of every augmentation and their types, parsed once when the pipeline is compiled
+AUGMENT_ARGS = {
+    "resize": {"width": int, "height": int},
+    "crop": {"prob": float, "min_crop": float},
+    "flip": {"prob": float, "type": int},
+    "rotate": {"prob": float, "min_degree": float, "max_degree": float},
+    "random_erase": {"prob": float, "max_erase": float},
+    "random_object_erase": {"prob": float, "max_erase": float},
+    "hsv_shift": {"prob": float, "hue": int, "saturation": int, "value": int},
+    "gauss_noise": {"prob": float, "mean": int, "variance": int},
+    "color_jitter": {"prob": float, "brightness": float, "contrast": float, "hue": float, "saturation": float}
+}
+
+
+def parse_args(section: str, raw_args: dict) -> dict:
+    args = {}
+    for key, arg_type in AUGMENT_ARGS[section].items():
+        if key not in raw_args:
+            raise InvalidGeneratorArgumentException(f"Missing argument '{key}' in augmentation section [{section}].")
+        try:
+            args[key] = arg_type(raw_args[key])
+        except ValueError:
+            raise InvalidGeneratorArgumentException(f"Argument '{key}' in augmentation section [{section}] must be "
+                                                    f"of type {arg_type.__name__}, got '{raw_args[key]}'.")
+    return args
+
+
+def plan(augment_config: configparser.ConfigParser, with_boxes: bool = False) -> list:
+    # (section, parsed arguments) of every augmentation section of the config in config order, sections that do
+    # not apply to the generator type are left out
+    sections = GENERAL_SECTIONS + (DETECTION_SECTIONS if with_boxes else CLASSIFICATION_SECTIONS)
+    return [(section, parse_args(section, dict(augment_config.items(section))))
+            for section in augment_config.sections() if section in sections]
+
+
+def affine_runs(sections: list) -> list:
+    # groups the positions of the sections into runs of consecutive geometric sections, every other section is a
+    # run of its own
+    runs = []
+    for i, section in enumerate(sections):
+        if section in AFFINE_SECTIONS and len(runs) > 0 and sections[runs[-1][-1]] in AFFINE_SECTIONS:
+            runs[-1].append(i)
+        else:
+            runs.append([i])
+    return runs
+
+
+def describe(steps: list) -> list:
+    # names of the steps of the compiled pipeline, fused sections joined by '+'
+    sections = [section for section, _ in steps]
+    return ['+'.join(sections[i] for i in run) for run in affine_runs(sections)]
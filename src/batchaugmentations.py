@@ -0,0 +1,142 @@
+import cv2
+import numpy as np
+
+'''
+This class offers vectorized versions of the augmentations for batches of same-size images.
+Images are stacked into one (N, H, W, C) uint8 array and boxes into one (N, K, 4) array of x0, y0, x1, y1 rows,
+padded with zeros for images with less than K boxes. Random parameters are drawn as arrays, one value per image,
+so a whole batch is augmented with a few NumPy operations instead of a Python call per image.
+'''
+
+# weights of the RGB channels when converting to grayscale, as used by albumentations
+GRAY_WEIGHTS = np.array([0.299, 0.587, 0.114], dtype=np.float32)
+
+
+class BatchAugmentations:
+
+    @staticmethod
+    def stack_boxes(boxes: list) -> tuple:
+        counts = np.array([len(image_boxes) for image_boxes in boxes], dtype=np.int64)
+        stacked = np.zeros((len(boxes), max(counts.max(initial=0), 1), 4), dtype=np.int64)
+        for i, image_boxes in enumerate(boxes):
+            for j, box in enumerate(image_boxes):
+                stacked[i, j] = (box['x0'], box['y0'], box['x1'], box['y1'])
+        return stacked, counts
+
+    @staticmethod
+    def unstack_boxes(stacked: np.ndarray, counts: np.ndarray) -> list:
+        return [[{'x0': int(x0), 'y0': int(y0), 'x1': int(x1), 'y1': int(y1)}
+                 for x0, y0, x1, y1 in stacked[i, :counts[i]]] for i in range(len(counts))]
+
+    @staticmethod
+    def select(num: int, prob: float) -> np.ndarray:
+        return np.random.uniform(0, 1, num) <= prob
+
+    @staticmethod
+    def rng() -> np.random.Generator:
+        # drawn from the seeded global state, so batches stay reproducible
+        return np.random.default_rng(np.random.randint(0, 2 ** 31))
+
+    @staticmethod
+    def convert(images: np.ndarray, code: int) -> np.ndarray:
+        # OpenCV converts the whole stack in one call when it is laid out as one tall image
+        n, height, width, channels = images.shape
+        return cv2.cvtColor(images.reshape(n * height, width, channels), code).reshape(n, height, width, -1)
+
+    @staticmethod
+    def flip(images: np.ndarray, boxes: np.ndarray, args: dict) -> tuple:
+        selected = BatchAugmentations.select(len(images), args['prob'])
+        if not selected.any():
+            return images, boxes
+        height, width = images.shape[1:3]
+        if args['type'] == 0:
+            images[selected] = images[selected, ::-1]
+            if boxes is not None:
+                boxes[selected, :, 1], boxes[selected, :, 3] = height - boxes[selected, :, 3], height - boxes[selected, :, 1]
+        else:
+            images[selected] = images[selected, :, ::-1]
+            if boxes is not None:
+                boxes[selected, :, 0], boxes[selected, :, 2] = width - boxes[selected, :, 2], width - boxes[selected, :, 0]
+        return images, boxes
+
+    @staticmethod
+    def random_erase(images: np.ndarray, boxes: np.ndarray, args: dict) -> tuple:
+        n, height, width, channels = images.shape
+        selected = BatchAugmentations.select(n, args['prob'])
+        crop_width = np.random.randint(0, int(width * args['max_erase']) + 1, n)
+        crop_height = np.random.randint(0, int(height * args['max_erase']) + 1, n)
+        crop_x0 = (np.random.uniform(0, 1, n) * (width - crop_width + 1)).astype(np.int64)
+        crop_y0 = (np.random.uniform(0, 1, n) * (height - crop_height + 1)).astype(np.int64)
+        values = np.random.randint(0, 256, (n, channels)).astype(np.uint8)
+        columns = np.arange(width)
+        rows = np.arange(height)
+        in_columns = (columns >= crop_x0[:, None]) & (columns < (crop_x0 + crop_width)[:, None])
+        in_rows = (rows >= crop_y0[:, None]) & (rows < (crop_y0 + crop_height)[:, None]) & selected[:, None]
+        mask = in_rows[:, :, None] & in_columns[:, None, :]
+        np.copyto(images, values[:, None, None, :], where=mask[:, :, :, None])
+        return images, boxes
+
+    @staticmethod
+    def gauss_noise(images: np.ndarray, boxes: np.ndarray, args: dict) -> tuple:
+        # same channel order as Augmentations.gauss_noise
+        images = np.ascontiguousarray(images[..., ::-1])
+        selected = BatchAugmentations.select(len(images), args['prob'])
+        if not selected.any():
+            return images, boxes
+        subset = images[selected]
+        sigma = np.sqrt(np.random.uniform(0, args['variance'], len(subset))).astype(np.float32)
+        noise = BatchAugmentations.rng().standard_normal(subset.shape, dtype=np.float32)
+        noise = noise * sigma[:, None, None, None] + args['mean']
+        images[selected] = np.clip(subset + noise, 0, 255).astype(np.uint8)
+        return images, boxes
+
+    @staticmethod
+    def hsv_shift(images: np.ndarray, boxes: np.ndarray, args: dict) -> tuple:
+        selected = BatchAugmentations.select(len(images), args['prob'])
+        if not selected.any():
+            return images, boxes
+        n = int(selected.sum())
+        # whole shifts as in albumentations, whose uint8 path applies them through lookup tables
+        shifts = np.rint(np.stack([np.random.uniform(-args['hue'], args['hue'], n),
+                                   np.random.uniform(-args['saturation'], args['saturation'], n),
+                                   np.random.uniform(-args['value'], args['value'], n)], axis=1)).astype(np.int16)
+        # images without any shift are left unchanged instead of being converted to HSV and back
+        shifted = shifts.any(axis=1)
+        if not shifted.any():
+            return images, boxes
+        indices = np.flatnonzero(selected)[shifted]
+        shifts = shifts[shifted]
+        # one lookup table per image and channel, indexed with the HSV values of the image
+        values = np.arange(256, dtype=np.int16)
+        luts = np.stack([np.mod(values + shifts[:, 0:1], 180),
+                         np.clip(values + shifts[:, 1:2], 0, 255),
+                         np.clip(values + shifts[:, 2:3], 0, 255)], axis=1).astype(np.uint8)
+        hsv = BatchAugmentations.convert(images[indices], cv2.COLOR_RGB2HSV)
+        rows = np.arange(len(indices))[:, None, None, None]
+        hsv = luts[rows, np.arange(3), hsv]
+        images[indices] = BatchAugmentations.convert(hsv, cv2.COLOR_HSV2RGB)
+        return images, boxes
+
+    @staticmethod
+    def color_jitter(images: np.ndarray, boxes: np.ndarray, args: dict) -> tuple:
+        selected = BatchAugmentations.select(len(images), args['prob'])
+        if not selected.any():
+            return images, boxes
+        n = int(selected.sum())
+        brightness = np.random.uniform(max(0, 1 - args['brightness']), 1 + args['brightness'], n)
+        contrast = np.random.uniform(max(0, 1 - args['contrast']), 1 + args['contrast'], n)
+        saturation = np.random.uniform(max(0, 1 - args['saturation']), 1 + args['saturation'], n)
+        hue = np.random.uniform(-args['hue'], args['hue'], n)
+        subset = images[selected].astype(np.float32)
+        subset = np.clip(subset * brightness[:, None, None, None].astype(np.float32), 0, 255)
+        gray = subset @ GRAY_WEIGHTS
+        mean = gray.mean(axis=(1, 2))[:, None, None, None]
+        factor = contrast[:, None, None, None].astype(np.float32)
+        subset = np.clip(subset * factor + mean * (1 - factor), 0, 255)
+        gray = (subset @ GRAY_WEIGHTS)[..., None]
+        factor = saturation[:, None, None, None].astype(np.float32)
+        subset = np.clip(subset * factor + gray * (1 - factor), 0, 255)
+        hsv = BatchAugmentations.convert(subset.astype(np.uint8), cv2.COLOR_RGB2HSV)
+        hsv[..., 0] = np.mod(hsv[..., 0].astype(np.float32) + (hue * 180)[:, None, None], 180).astype(np.uint8)
+        images[selected] = BatchAugmentations.convert(hsv, cv2.COLOR_HSV2RGB)
+        return images, boxes
@@ -0,0 +1,237 @@
+import argparse
+import configparser
+import contextlib
+import io
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+import cv2
+import numpy as np
+import augmentapplier
+from augmentations import BoxAugmentations
+from generators import ClassificationGenerator, DetectionGenerator
+from placement import PlacementEngine
+from spritepyramid import SpritePyramid
+
+'''
+Throughput benchmark for the augmentations and the generators.
+Everything runs on synthetic images, so no image sources are needed. Every benchmark reports images per second and
+the p50/p99 latency of a single call as JSON. Results can be saved as a baseline and later runs compared against it,
+a benchmark whose throughput drops by more than the tolerance counts as a regression.
+'''
+
+# arguments of the benchmarked augmentations, in the format of the config sections
+AUGMENT_ARGS = {
+    "resize": {"width": "512", "height": "512"},
+    "crop": {"prob": "1.0", "min_crop": "0.5"},
+    "flip": {"prob": "1.0", "type": "1"},
+    "rotate": {"prob": "1.0", "min_degree": "-45", "max_degree": "45"},
+    "random_erase": {"prob": "1.0", "max_erase": "0.3"},
+    "random_object_erase": {"prob": "1.0", "max_erase": "0.3"},
+    "hsv_shift": {"prob": "1.0", "hue": "10", "saturation": "10", "value": "10"},
+    "gauss_noise": {"prob": "1.0", "mean": "0", "variance": "500"},
+    "color_jitter": {"prob": "1.0", "brightness": "0.2", "contrast": "0.2", "hue": "0.1", "saturation": "0.2"}
+}
+
+OBJECT_COUNTS = [1, 5, 10, 20, 50, 100]
+
+
+def synthetic_image(width: int, height: int) -> np.ndarray:
+    # smooth gradients with some noise compress and augment like photos rather than like pure noise
+    x = np.linspace(0, 255, width, dtype=np.float32)[None, :]
+    y = np.linspace(0, 255, height, dtype=np.float32)[:, None]
+    image = np.stack([np.broadcast_to(x, (height, width)), np.broadcast_to(y, (height, width)),
+                      np.broadcast_to((x + y) / 2, (height, width))], axis=2)
+    image = image + np.random.normal(0, 10, image.shape)
+    return np.clip(image, 0, 255).astype(np.uint8)
+
+
+def synthetic_sprite(size: int) -> np.ndarray:
+    # an opaque disc with transparent margins, like a cut out object
+    alpha = np.zeros((size, size), dtype=np.uint8)
+    cv2.circle(alpha, (size // 2, size // 2), size // 3, 255, -1)
+    return np.dstack([synthetic_image(size, size), alpha])
+
+
+def summarize(timings: list) -> dict:
+    timings = np.array(timings)
+    return {
+        'images_per_sec': len(timings) / timings.sum() if timings.sum() > 0 else 0.0,
+        'p50_ms': float(np.percentile(timings, 50) * 1000),
+        'p99_ms': float(np.percentile(timings, 99) * 1000),
+        'iterations': len(timings)
+    }
+
+
+def time_calls(function, make_input, iterations: int, warmup: int = 2) -> list:
+    # inputs are prepared outside of the timed region, since augmentations may change them in place
+    timings = []
+    with contextlib.redirect_stdout(io.StringIO()):
+        for i in range(warmup + iterations):
+            args = make_input()
+            start = time.perf_counter()
+            function(*args)
+            if i >= warmup:
+                timings.append(time.perf_counter() - start)
+    return timings
+
+
+def bench_augmentations(resolutions: list, iterations: int) -> dict:
+    results = {}
+    for size in resolutions:
+        image = synthetic_image(size, size)
+        boxes = [{'x0': size // 8, 'y0': size // 8, 'x1': size // 2, 'y1': size // 2},
+                 {'x0': size // 2, 'y0': size // 4, 'x1': size - 1, 'y1': size - 1}]
+        for section, augment in {**augmentapplier.GENERAL_AUGMENTS, **augmentapplier.CLASSIFICATION_AUGMENTS}.items():
+            args = augmentapplier.parse_args(section, AUGMENT_ARGS[section])
+            timings = time_calls(augment, lambda: (image.copy(), args), iterations)
+            results[f'Augmentations.{section}@{size}'] = summarize(timings)
+        for section, augment in augmentapplier.DETECTION_AUGMENTS.items():
+            args = augmentapplier.parse_args(section, AUGMENT_ARGS[section])
+            timings = time_calls(augment, lambda: (image.copy(), [dict(box) for box in boxes], args), iterations)
+            results[f'BoxAugmentations.{section}@{size}'] = summarize(timings)
+        # the geometric augmentations of a config are fused into one warp
+        pipeline = augmentapplier.compile(augment_config(['resize', 'crop', 'rotate', 'flip']))
+        timings = time_calls(pipeline, lambda: (image.copy(),), iterations)
+        results[f'AugmentPipeline.{"+".join(pipeline.sections())}@{size}'] = summarize(timings)
+    return results
+
+
+def bench_overlay(resolutions: list, iterations: int) -> dict:
+    results = {}
+    for size in resolutions:
+        image = synthetic_image(size, size)
+        sprites = [synthetic_sprite(300), synthetic_sprite(200)]
+        pyramids = [SpritePyramid.build(sprite) for sprite in sprites]
+        for count in OBJECT_COUNTS:
+            objects = [sprites[i % len(sprites)] for i in range(count)]
+            # cropped and downscaled sprites, as pasted by the detection generator
+            timings = time_calls(BoxAugmentations.overlay_objects,
+                                 lambda: (image.copy(), [pyramids[i % len(pyramids)] for i in range(count)]), iterations)
+            results[f'BoxAugmentations.overlay_objects[{count} objects, mask, pyramid]@{size}'] = summarize(timings)
+            for mode in ['mask', 'alpha']:
+                timings = time_calls(BoxAugmentations.overlay_objects, lambda: (image.copy(), objects, mode), iterations)
+                results[f'BoxAugmentations.overlay_objects[{count} objects, {mode}]@{size}'] = summarize(timings)
+            # placing under overlap limits, objects without a valid position are skipped
+            timings = time_calls(BoxAugmentations.overlay_objects,
+                                 lambda: (image.copy(), objects, 'mask', 0, PlacementEngine(size, size, 0.3, 0.5)),
+                                 iterations)
+            results[f'BoxAugmentations.overlay_objects[{count} objects, max_iou 0.3, max_occlusion 0.5]@{size}'] = summarize(timings)
+    return results
+
+
+def augment_config(sections: list) -> configparser.ConfigParser:
+    config = configparser.ConfigParser()
+    for section in sections:
+        config[section] = AUGMENT_ARGS[section]
+    return config
+
+
+def bench_generators(resolutions: list, num: int) -> dict:
+    results = {}
+    with tempfile.TemporaryDirectory() as root:
+        for size in resolutions:
+            backgrounds = os.path.join(root, f'backgrounds_{size}')
+            objects = os.path.join(root, 'objects')
+            output = os.path.join(root, 'output', '')
+            for dir in [backgrounds, os.path.join(objects, 'discs'), output]:
+                os.makedirs(dir, exist_ok=True)
+            for i in range(4):
+                cv2.imwrite(os.path.join(backgrounds, f'background_{i}.jpg'), synthetic_image(size, size))
+                cv2.imwrite(os.path.join(objects, 'discs', f'disc_{i}.png'), synthetic_sprite(100 + 50 * i))
+            generators = {
+                'ClassificationGenerator': ClassificationGenerator(
+                    backgrounds, output, num, augment_config(['resize', 'flip', 'rotate', 'random_erase', 'hsv_shift']),
+                    seed=0),
+                'DetectionGenerator': DetectionGenerator(
+                    backgrounds, objects, num, output, 'json', output, 10,
+                    augment_config(['flip', 'resize', 'random_object_erase', 'hsv_shift']), seed=0)
+            }
+            for name, generator in generators.items():
+                # latency of single samples from the in-memory iterator, throughput from a full run writing images
+                timings = []
+                samples = generator.iter_samples()
+                with contextlib.redirect_stdout(io.StringIO()):
+                    while True:
+                        start = time.perf_counter()
+                        if next(samples, None) is None:
+                            break
+                        timings.append(time.perf_counter() - start)
+                    start = time.perf_counter()
+                    generator.generate()
+                    elapsed = time.perf_counter() - start
+                result = summarize(timings)
+                result['images_per_sec'] = num / elapsed
+                results[f'{name}.generate@{size}'] = result
+    return results
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list:
+    regressions = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        before = baseline[name]['images_per_sec']
+        after = result['images_per_sec']
+        change = (after - before) / before if before > 0 else 0.0
+        result['baseline_images_per_sec'] = before
+        result['change'] = change
+        if change < -tolerance:
+            regressions.append(f'{name}: {before:.1f} -> {after:.1f} images/sec ({change:+.1%})')
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measures the throughput of the augmentations and generators on synthetic images.')
+    parser.add_argument('--resolutions', type=str, default='256,512,1024', help='Comma separated square image sizes.')
+    parser.add_argument('--iterations', type=int, default=50, help='Timed calls per augmentation benchmark.')
+    parser.add_argument('--num', type=int, default=20, help='Images generated per generator benchmark.')
+    parser.add_argument('--suites', type=str, default='augmentations,overlay,generators', help='Comma separated benchmark suites to run.')
+    parser.add_argument('--seed', type=int, default=0, help='Seed of the synthetic images and augmentations.')
+    parser.add_argument('--output', type=str, help='Path the JSON results are written to, printed if not given.')
+    parser.add_argument('--baseline', type=str, help='JSON results of an earlier run to compare against.')
+    parser.add_argument('--tolerance', type=float, default=0.1, help='Allowed relative throughput drop before a benchmark counts as a regression.')
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    np.random.seed(args.seed)
+    resolutions = [int(size) for size in args.resolutions.split(',')]
+    suites = args.suites.split(',')
+    results = {}
+    if 'augmentations' in suites:
+        results.update(bench_augmentations(resolutions, args.iterations))
+    if 'overlay' in suites:
+        results.update(bench_overlay(resolutions, args.iterations))
+    if 'generators' in suites:
+        results.update(bench_generators(resolutions, args.num))
+
+    regressions = []
+    if args.baseline is not None:
+        with open(args.baseline, 'r') as f:
+            regressions = compare(results, json.load(f)['results'], args.tolerance)
+    report = {
+        'meta': {
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'opencv': cv2.__version__,
+            'machine': platform.machine(),
+            'cpus': os.cpu_count()
+        },
+        'results': results
+    }
+    if args.output is not None:
+        with open(args.output, 'w') as outfile:
+            json.dump(report, outfile, indent=4)
+    else:
+        print(json.dumps(report, indent=4))
+    for regression in regressions:
+        print(f'Regression: {regression}', file=sys.stderr)
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == '__main__':
+    main()
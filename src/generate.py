@@ -2,43 +2,200 @@ import argparse
 import configparser
 from pprint import pprint
 import traceback
-from generators import ClassificationGenerator, DetectionGenerator
 import copy
+import augmentplan
+import generatorarguments
 from generatorexception import InvalidGeneratorArgumentException
+from sourcecatalog import SourceCatalog
+from sourcevalidator import SourceValidator, VALIDATION_MODES
+from outputwriters import AsyncWriter, IMAGE_FORMATS, OUTPUT_TYPES
+from instrumentation import Metrics, METRICS_FORMATS
+from runmanifest import RunManifest
 
-parser = argparse.ArgumentParser(description='Augments images for image classifcation to improve dataset or/and it increase if')
-parser.add_argument('-c', '--config', type=str, help='Path to config file controlling generator type and augmentations.', required=True)
-args = parser.parse_args()
-config_path = args.config
-config = configparser.ConfigParser()
 
-try:
-    with open(config_path, 'r') as f:
-        config.read_file(f) 
-    augment_config = copy.deepcopy(config)
-    augment_config.remove_section('generator')
-    if config.get('generator', 'type') == 'classification':
-        generator = ClassificationGenerator(image_source=config.get('generator', 'img_source'),
+def main():
+    parser = argparse.ArgumentParser(description='Augments images for image classifcation to improve dataset or/and it increase if')
+    parser.add_argument('-c', '--config', type=str, help='Path to config file controlling generator type and augmentations.', required=True)
+    parser.add_argument('-w', '--workers', type=int, help='Number of worker processes, overrides the workers key of the config.')
+    parser.add_argument('--resume', action='store_true', help='Generates only the images missing from the run manifest, to continue an interrupted run or extend a finished one.')
+    parser.add_argument('--prepare', action='store_true', help='Decodes all sources into the arena set in the config instead of generating images.')
+    parser.add_argument('--num-shards', type=int, default=1, help='Number of nodes a run is split across, every node generates one slice of the images.')
+    parser.add_argument('--shard-index', type=int, default=0, help='Slice of the images generated by this node, from 0 to the number of shards - 1.')
+    parser.add_argument('--merge', action='store_true', help='Checks that all shards of a split run are complete and merges their manifests and annotations.')
+    parser.add_argument('--dry-run', action='store_true', help='Checks the config and the sources and prints the planned run without loading the image libraries or generating images.')
+    args = parser.parse_args()
+    config_path = args.config
+    config = configparser.ConfigParser()
+
+    try:
+        with open(config_path, 'r') as f:
+            config.read_file(f) 
+        augment_config = copy.deepcopy(config)
+        augment_config.remove_section('generator')
+        workers = args.workers if args.workers is not None else config.getint('generator', 'workers', fallback=1)
+        seed = config.getint('generator', 'seed', fallback=None)
+        batch_size = config.getint('generator', 'batch_size', fallback=1)
+        reduced_decoding = config.getboolean('generator', 'reduced_decoding', fallback=True)
+        validation = config.get('generator', 'validation', fallback='fast').lower()
+        if validation not in VALIDATION_MODES:
+            raise InvalidGeneratorArgumentException('Specified validation mode is not valid, please choose either \'fast\' or \'strict\'.')
+        validator = SourceValidator(mode=validation,
+                                    cache_path=config.get('generator', 'validation_cache', fallback=None),
+                                    workers=config.getint('generator', 'validation_workers', fallback=None))
+        image_format = config.get('generator', 'image_format', fallback='jpg').lower()
+        if image_format not in IMAGE_FORMATS:
+            raise InvalidGeneratorArgumentException('Specified image format is not valid, please choose either \'jpg\', \'png\' or \'webp\'.')
+        output = config.get('generator', 'output', fallback='files').lower()
+        if output not in OUTPUT_TYPES:
+            raise InvalidGeneratorArgumentException('Specified output type is not valid, please choose either \'files\' or \'shards\'.')
+        writer = AsyncWriter(threads=config.getint('generator', 'writer_threads', fallback=2),
+                             queue_size=config.getint('generator', 'writer_queue_size', fallback=64),
+                             image_format=image_format,
+                             jpeg_quality=config.getint('generator', 'jpeg_quality', fallback=95),
+                             png_compression=config.getint('generator', 'png_compression', fallback=3),
+                             webp_quality=config.getint('generator', 'webp_quality', fallback=90),
+                             output=output,
+                             shard_size=config.getint('generator', 'shard_size', fallback=1000))
+        metrics_format = config.get('generator', 'metrics_format', fallback='json').lower()
+        if metrics_format not in METRICS_FORMATS:
+            raise InvalidGeneratorArgumentException('Specified metrics format is not valid, please choose either \'json\' or \'prometheus\'.')
+        metrics = Metrics(enabled=config.getboolean('generator', 'metrics', fallback=False),
+                          progress_interval=config.getfloat('generator', 'progress_interval', fallback=10.0),
+                          output=config.get('generator', 'metrics_output', fallback=None),
+                          output_format=metrics_format)
+        # the run manifest records every written sample, so that the run can be resumed
+        manifest_path = config.get('generator', 'manifest', fallback=None)
+        # every node of a split run keeps its own manifest, merging combines them into the configured one
+        if args.merge:
+            generatorarguments.check_merge(args.num_shards)
+        num_shards = 1 if args.merge else args.num_shards
+        shard_index = 0 if args.merge else args.shard_index
+        manifest = RunManifest(RunManifest.node_path(manifest_path, shard_index, num_shards)) if manifest_path is not None else None
+        # the arena holds decoded sources that all worker processes share, it is written by --prepare
+        arena_path = config.get('generator', 'arena', fallback=None)
+        if args.prepare and arena_path is None:
+            raise InvalidGeneratorArgumentException('Preparing sources requires an arena path in the config.')
+        # the catalog manifest lets repeated runs skip scanning the source directories
+        object_source = config.get('generator', 'obj_source') if config.get('generator', 'type') == 'detection' else None
+        if args.dry_run:
+            # everything in a dry run only needs the standard library and NumPy, the generators are not imported at
+            # all. Their arguments are checked by the same functions their setters use, and nothing is written
+            generator_type = config.get('generator', 'type')
+            if generator_type not in ('classification', 'detection'):
+                raise InvalidGeneratorArgumentException('Specified generator type is not valid, please choose either \'classification\' or \'detection\'.')
+            num = int(config.get('generator', 'img_num'))
+            generatorarguments.check_img_output_dir(config.get('generator', 'img_output_dir'))
+            generatorarguments.check_num(num)
+            generatorarguments.check_workers(workers)
+            generatorarguments.check_seed(seed)
+            generatorarguments.check_partition(num_shards, shard_index, seed is None)
+            generatorarguments.check_batch_size(batch_size)
+            generatorarguments.check_writer(writer.threads, writer.queue_size, writer.shard_size)
+            if generator_type == 'detection':
+                generatorarguments.check_annotation_format(config.get('generator', 'annotation_format'))
+                generatorarguments.check_annotation_output_dir(config.get('generator', 'annotation_output_dir'))
+                generatorarguments.check_max_objects(int(config.get('generator', 'max_obj')))
+                generatorarguments.check_blend_mode(config.get('generator', 'blend', fallback='mask'))
+                generatorarguments.check_feather(config.getint('generator', 'feather', fallback=0))
+                generatorarguments.check_placement(config.getfloat('generator', 'max_iou', fallback=1.0),
+                                                   config.getfloat('generator', 'max_occlusion', fallback=1.0),
+                                                   config.getint('generator', 'placement_attempts', fallback=20))
+        # the source directories are checked before the catalog scans them, like the setters of the generators do
+        generatorarguments.check_image_source(config.get('generator', 'img_source'))
+        if object_source is not None:
+            generatorarguments.check_objects_source(object_source)
+        catalog = SourceCatalog.open(config.get('generator', 'catalog', fallback=None),
+                                     config.get('generator', 'img_source'), object_source,
+                                     SourceCatalog.parse_class_weights(config.get('generator', 'class_weights', fallback='')),
+                                     save=not args.dry_run)
+        if args.dry_run:
+            catalog.check_backgrounds(validator)
+            if generator_type == 'detection':
+                catalog.check_objects(validator)
+            steps = augmentplan.plan(augment_config if generator_type == 'classification' else config,
+                                     with_boxes=generator_type == 'detection')
+            print(f'Dry run of the {generator_type} generator, no images are generated.')
+            print(f'Sources: {len(catalog.backgrounds)} ' + ('backgrounds' if generator_type == 'detection' else 'images')
+                  + (f', objects of {len(catalog.classes)} classes ('
+                     + ', '.join(f'{label}: {len(catalog.objects[label])}' for label in catalog.classes) + ')'
+                     if generator_type == 'detection' else '') + '.')
+            print(f'Images: {num} with seed {seed if seed is not None else "drawn at the start"}, {workers} worker(s), '
+                  f'batch size {batch_size}' + (f', shard {shard_index} of {num_shards}' if num_shards > 1 else '') + '.')
+            print('Pipeline: ' + (' -> '.join(augmentplan.describe(steps)) if len(steps) > 0 else 'no augmentations') + '.')
+            print(f'Output: {image_format} {output} in {config.get("generator", "img_output_dir")}'
+                  + (f', {config.get("generator", "annotation_format").lower()} annotations in '
+                     f'{config.get("generator", "annotation_output_dir")}' if generator_type == 'detection' else '') + '.')
+            return
+        # imported only when images are generated, they load OpenCV and the augmentation backends
+        from generators import ClassificationGenerator, DetectionGenerator, DEFAULT_CACHE_SIZE_MB
+        from imagecache import ImageCache
+        from sourcearena import SourceArena
+        # one cache shared by whichever generator is created
+        cache = ImageCache(config.getint('generator', 'cache_size_mb', fallback=DEFAULT_CACHE_SIZE_MB) * 1024 * 1024)
+        arena = SourceArena.open(arena_path) if arena_path is not None and not args.prepare and SourceArena.exists(arena_path) else None
+        if config.get('generator', 'type') == 'classification':
+            generator = ClassificationGenerator(image_source=config.get('generator', 'img_source'),
+                                                img_output_dir=config.get('generator', 'img_output_dir'),
+                                                num=int(config.get('generator', 'img_num')),
+                                                augment_config=augment_config,
+                                                cache=cache,
+                                                workers=workers,
+                                                seed=seed,
+                                                catalog=catalog,
+                                                validator=validator,
+                                                batch_size=batch_size,
+                                                writer=writer,
+                                                metrics=metrics,
+                                                manifest=manifest,
+                                                arena=arena,
+                                                reduced_decoding=reduced_decoding,
+                                                num_shards=num_shards,
+                                                shard_index=shard_index)
+        elif config.get('generator', 'type') == 'detection':
+            generator = DetectionGenerator(image_source=config.get('generator', 'img_source'),
+                                            object_source=config.get('generator', 'obj_source'),
                                             img_output_dir=config.get('generator', 'img_output_dir'),
+                                            annotation_format=config.get('generator', 'annotation_format'),
+                                            annotation_output_dir=config.get('generator', 'annotation_output_dir'), 
                                             num=int(config.get('generator', 'img_num')),
-                                            augment_config=augment_config)
-    elif config.get('generator', 'type') == 'detection':
-        generator = DetectionGenerator(image_source=config.get('generator', 'img_source'),
-                                        object_source=config.get('generator', 'obj_source'),
-                                        img_output_dir=config.get('generator', 'img_output_dir'),
-                                        annotation_format=config.get('generator', 'annotation_format'),
-                                        annotation_output_dir=config.get('generator', 'annotation_output_dir'), 
-                                        num=int(config.get('generator', 'img_num')),
-                                        max_objects=int(config.get('generator', 'max_obj')),
-                                        augment_config=config)
-    else:
-        raise InvalidGeneratorArgumentException('Specified generator type is not valid, please choose either \'classification\' or \'detection\'.')
-    generator.generate()
-except (FileNotFoundError, configparser.Error, InvalidGeneratorArgumentException) as exc:
-    print(f'An error occurred: {type(exc).__name__} – {exc}')
-except KeyError as exc:
-    _, _, funcname, _ = traceback.extract_tb(exc.__traceback__)[-1]
-    print(f'An error occurred: {type(exc).__name__} – missing argument {exc} in {funcname}')
-except ValueError as exc:
-    _, _, funcname, _ = traceback.extract_tb(exc.__traceback__)[-1]
-    print(f'An error occurred: {type(exc).__name__} – in {funcname} {exc}')
\ No newline at end of file
+                                            max_objects=int(config.get('generator', 'max_obj')),
+                                            augment_config=config,
+                                            blend_mode=config.get('generator', 'blend', fallback='mask'),
+                                            feather=config.getint('generator', 'feather', fallback=0),
+                                            max_iou=config.getfloat('generator', 'max_iou', fallback=1.0),
+                                            max_occlusion=config.getfloat('generator', 'max_occlusion', fallback=1.0),
+                                            placement_attempts=config.getint('generator', 'placement_attempts', fallback=20),
+                                            cache=cache,
+                                            workers=workers,
+                                            seed=seed,
+                                            catalog=catalog,
+                                            validator=validator,
+                                            batch_size=batch_size,
+                                            writer=writer,
+                                            metrics=metrics,
+                                            manifest=manifest,
+                                            arena=arena,
+                                            reduced_decoding=reduced_decoding,
+                                            num_shards=num_shards,
+                                            shard_index=shard_index)
+        else:
+            raise InvalidGeneratorArgumentException('Specified generator type is not valid, please choose either \'classification\' or \'detection\'.')
+        if args.prepare:
+            generator.prepare_arena(arena_path)
+        elif args.merge:
+            generator.merge_partitions(args.num_shards)
+        else:
+            generator.generate(resume=args.resume)
+    except (FileNotFoundError, configparser.Error, InvalidGeneratorArgumentException) as exc:
+        print(f'An error occurred: {type(exc).__name__} – {exc}')
+    except KeyError as exc:
+        _, _, funcname, _ = traceback.extract_tb(exc.__traceback__)[-1]
+        print(f'An error occurred: {type(exc).__name__} – missing argument {exc} in {funcname}')
+    except ValueError as exc:
+        _, _, funcname, _ = traceback.extract_tb(exc.__traceback__)[-1]
+        print(f'An error occurred: {type(exc).__name__} – in {funcname} {exc}')
+
+
+# worker processes started by spawn or forkserver import this module again, which must not start another run
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,107 @@
+import os
+import annotationwriters
+from generatorexception import InvalidGeneratorArgumentException
+
+'''
+These functions check the arguments of the generators. The setters of the generators call them, and a dry run of
+generate.py calls them on the values of the config without creating a generator, so that both report the same
+errors while the dry run does not load any image library.
+'''
+
+BLEND_MODES = ['mask', 'alpha']
+
+
+def valid_dir(dir: str) -> bool:
+    if os.path.isdir(dir) and len(os.listdir(dir)) != 0:
+        return True
+    return False
+
+
+def check_image_source(image_source: str):
+    if not valid_dir(image_source):
+        raise InvalidGeneratorArgumentException("Image source directory is not a directory or is empty.")
+
+
+def check_img_output_dir(img_output_dir: str):
+    if not os.path.isdir(img_output_dir):
+        raise InvalidGeneratorArgumentException("No directory found under img_output_dir path.")
+
+
+def check_num(num: int):
+    if type(num) == int and num < 0:
+        raise InvalidGeneratorArgumentException("Number of set output images must be positive.")
+
+
+def check_workers(workers: int):
+    if workers < 1:
+        raise InvalidGeneratorArgumentException("Number of workers must be at least 1.")
+
+
+def check_batch_size(batch_size: int):
+    if batch_size < 1:
+        raise InvalidGeneratorArgumentException("Batch size must be at least 1.")
+
+
+def check_writer(threads: int, queue_size: int, shard_size: int):
+    if threads < 0 or queue_size < 1:
+        raise InvalidGeneratorArgumentException("Writer needs a non-negative number of threads and a queue size of at least 1.")
+    if shard_size < 1:
+        raise InvalidGeneratorArgumentException("Shard size must be at least 1.")
+
+
+def check_seed(seed: int):
+    if seed is not None and seed < 0:
+        raise InvalidGeneratorArgumentException("Seed must not be negative.")
+
+
+def check_partition(num_shards: int, shard_index: int, seed_drawn: bool):
+    # a run split across nodes generates one slice of the indices on every node
+    if num_shards < 1 or not 0 <= shard_index < num_shards:
+        raise InvalidGeneratorArgumentException("Shard index must be between 0 and the number of shards - 1.")
+    if num_shards > 1 and seed_drawn:
+        raise InvalidGeneratorArgumentException("Splitting a run into shards requires a fixed seed.")
+
+
+def check_merge(num_shards: int):
+    # merging combines the files of several nodes into those of the run, a single node has nothing to merge
+    if num_shards < 2:
+        raise InvalidGeneratorArgumentException("Merging requires the number of shards the run was split into, "
+                                                "at least 2.")
+
+
+def check_objects_source(objects_source: str):
+    if not valid_dir(objects_source):
+        raise InvalidGeneratorArgumentException("Object source directory not a real directory or is empty.")
+
+
+def check_annotation_format(annotation_format: str):
+    if not annotation_format.lower() in annotationwriters.ACCEPTED_ANNOTATION_FORMATS:
+        raise InvalidGeneratorArgumentException("Specified annotation format not a valid format, accepted formats "
+                                                "are xml, json, yolo, coco & jsonl")
+
+
+def check_annotation_output_dir(output_dir: str):
+    if not os.path.isdir(output_dir):
+        raise InvalidGeneratorArgumentException("No directory found under specified annotation-output-path.")
+
+
+def check_max_objects(max_objects: int):
+    if max_objects < 1:
+        raise InvalidGeneratorArgumentException("Number of max objects per image must be at least 1.")
+
+
+def check_blend_mode(blend_mode: str):
+    if not blend_mode.lower() in BLEND_MODES:
+        raise InvalidGeneratorArgumentException("Specified blend mode not valid, accepted modes are mask & alpha.")
+
+
+def check_feather(feather: int):
+    if feather < 0:
+        raise InvalidGeneratorArgumentException("Feather radius must not be negative.")
+
+
+def check_placement(max_iou: float, max_occlusion: float, attempts: int):
+    if not 0 <= max_iou <= 1 or not 0 <= max_occlusion <= 1:
+        raise InvalidGeneratorArgumentException("Maximum IoU and occlusion must be between 0 and 1.")
+    if attempts < 1:
+        raise InvalidGeneratorArgumentException("Number of placement attempts must be at least 1.")
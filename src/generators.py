@@ -1,83 +1,534 @@
+import hashlib
+import json
+import math
 import os
 import random
-import types
 from abc import ABC, abstractmethod
 import cv2
 from augmentations import BoxAugmentations
+from placement import PlacementEngine
+from spritepyramid import SpritePyramid
+from sourcearena import SourceArena
 import augmentapplier
 import annotationwriters
+import generatorarguments
+from imagecache import ImageCache
+from sourcecatalog import SourceCatalog
+from sourcevalidator import SourceValidator
+from outputwriters import AsyncWriter
+from prefetcher import Prefetcher
+from instrumentation import Metrics
+from runmanifest import RunManifest, sample_seed
 from generatorexception import InvalidGeneratorArgumentException
 import configparser
+import itertools
+import multiprocessing
+import numpy as np
+
+DEFAULT_CACHE_SIZE_MB = 512
+# every worker gets several chunks so that slow chunks do not leave the other workers idle
+CHUNKS_PER_WORKER = 4
+# reduced decoding modes of OpenCV by their downscale factor, JPEGs are downscaled while decoding
+REDUCED_DECODE_FLAGS = {8: cv2.IMREAD_REDUCED_COLOR_8, 4: cv2.IMREAD_REDUCED_COLOR_4, 2: cv2.IMREAD_REDUCED_COLOR_2}
+
+# generator used by a worker process, set once by the pool initializer
+_worker_generator = None
+
+
+def _init_worker(generator):
+    global _worker_generator
+    _worker_generator = generator
+    # progress is reported by the parent process as chunks complete
+    _worker_generator.metrics.progress_interval = None
+    # one process per core already saturates the machine, OpenCV's own threads would only compete with it
+    cv2.setNumThreads(1)
+
+
+def _generate_chunk(bounds: tuple) -> tuple:
+    before = _worker_generator.counters()
+    _worker_generator.metrics.reset()
+    _worker_generator.generate_range(bounds[0], bounds[1])
+    after = _worker_generator.counters()
+    return bounds[1] - bounds[0], {key: after[key] - before[key] for key in after}, _worker_generator.metrics.snapshot()
 
 
 class Generator(ABC):
 
-    def __init__(self, image_source: str, img_output_dir: str, num: int, augment_config: configparser.ConfigParser):
+    def __init__(self, image_source: str, img_output_dir: str, num: int, augment_config: configparser.ConfigParser,
+                 cache: ImageCache = None, workers: int = 1, seed: int = None, validator: SourceValidator = None,
+                 batch_size: int = 1, writer: AsyncWriter = None, metrics: Metrics = None,
+                 manifest: RunManifest = None, arena: SourceArena = None, reduced_decoding: bool = True,
+                 num_shards: int = 1, shard_index: int = 0):
         self.set_image_source(image_source)
         self.set_img_output_dir(img_output_dir)
         self.set_num(num)
         self.set_augment_config(augment_config)
-
-    @staticmethod
-    def valid_dir(dir: str) -> bool:
-        if os.path.isdir(dir) and len(os.listdir(dir)) != 0:
-            return True
-        return False
-
-    @staticmethod
-    def dir_contains_only_imgs(dir: str) ->bool:
-        for file in os.listdir(dir):
-            img = cv2.imread(os.path.join(dir, file))
-            # if img is of type NoneType then it cannot be a valid image file (expected: numpy.ndarray)
-            if type(img) == types.NoneType:
-                return False
-        return True
-
-    @staticmethod
-    def get_random_file(dir: str) -> str:
-        files = os.listdir(dir)
-        return os.path.join(dir, files[random.randint(0, len(files) - 1)])
+        self.set_cache(cache)
+        self.set_workers(workers)
+        self.set_seed(seed)
+        self.set_partition(num_shards, shard_index)
+        self.set_validator(validator)
+        self.set_batch_size(batch_size)
+        self.set_writer(writer)
+        self.set_metrics(metrics)
+        self.set_manifest(manifest)
+        self.set_arena(arena)
+        self.set_reduced_decoding(reduced_decoding)
 
     def set_image_source(self, image_source: str):
-        if not Generator.valid_dir(image_source):
-            raise InvalidGeneratorArgumentException("Image source directory is not a directory or is empty.")
-        if not Generator.dir_contains_only_imgs(image_source):
-            raise InvalidGeneratorArgumentException("Image directory must only contain images (jpeg, png, ...).")
+        generatorarguments.check_image_source(image_source)
         self.image_source = image_source
 
     def set_img_output_dir(self, img_output_dir: str):
-        if not os.path.isdir(img_output_dir):
-            raise InvalidGeneratorArgumentException("No directory found under img_output_dir path.")
+        generatorarguments.check_img_output_dir(img_output_dir)
         self.img_output_dir = img_output_dir
 
     def set_num(self, num: int):
-        if type(num) == int and num < 0:
-            raise InvalidGeneratorArgumentException("Number of set output images must be positive.")
+        generatorarguments.check_num(num)
         self.num = num
 
     def set_augment_config(self, augment_config: configparser.ConfigParser):
         if augment_config == None:
             raise InvalidGeneratorArgumentException("No configparser object provided.")
         self.augment_config = augment_config
+        # the config is compiled once, so errors in it are reported before the first image is generated
+        self.pipeline = self.compile_pipeline(augment_config)
+
+    def compile_pipeline(self, augment_config: configparser.ConfigParser) -> augmentapplier.AugmentPipeline:
+        return augmentapplier.compile(augment_config)
+
+    def set_cache(self, cache: ImageCache):
+        # without a shared cache every generator gets its own one with the default budget
+        if cache is None:
+            cache = ImageCache(DEFAULT_CACHE_SIZE_MB * 1024 * 1024)
+        self.cache = cache
+
+    def set_catalog(self, catalog: SourceCatalog):
+        # without a catalog from a manifest the source directories are scanned once here
+        if catalog is None:
+            catalog = self.build_catalog()
+        catalog.check_backgrounds(self.validator)
+        self.validator.save()
+        self.catalog = catalog
 
     @abstractmethod
-    def generate(self):
+    def build_catalog(self) -> SourceCatalog:
         pass
 
+    def set_validator(self, validator: SourceValidator):
+        if validator is None:
+            validator = SourceValidator()
+        self.validator = validator
 
-class ClassificationGenerator(Generator):
+    def set_workers(self, workers: int):
+        generatorarguments.check_workers(workers)
+        self.workers = workers
+
+    def set_batch_size(self, batch_size: int):
+        generatorarguments.check_batch_size(batch_size)
+        self.batch_size = batch_size
+
+    def set_writer(self, writer: AsyncWriter):
+        if writer is None:
+            writer = AsyncWriter()
+        generatorarguments.check_writer(writer.threads, writer.queue_size, writer.shard_size)
+        self.writer = writer
+
+    def set_metrics(self, metrics: Metrics):
+        if metrics is None:
+            metrics = Metrics()
+        self.metrics = metrics
+        self.pipeline.metrics = metrics
+        self.writer.metrics = metrics
+
+    def set_manifest(self, manifest: RunManifest):
+        self.manifest = manifest
+        self.writer.manifest = manifest
+
+    def set_arena(self, arena: SourceArena):
+        self.arena = arena
+
+    def sprite_sources(self) -> list:
+        return []
+
+    def prepare_arena(self, path: str):
+        # decodes all sources of the catalog into an arena that later runs share between their worker processes
+        self.set_arena(SourceArena.prepare(path, self.catalog.backgrounds, self.sprite_sources(),
+                                           decode_flags=self.decode_flags))
+        stats = self.arena.stats()
+        print(f'Arena: {stats["images"]} images, {stats["sprites"]} sprites, '
+              f'{stats["bytes"] / (1024 * 1024):.1f} MB written to {SourceArena.data_path(path)}.')
+
+    def set_reduced_decoding(self, reduced_decoding: bool):
+        # images are only decoded at a reduced size if the pipeline starts by resizing them, any other first step
+        # would see a different image
+        self.reduced_decoding = reduced_decoding
+        self.decode_size = self.pipeline.input_size() if reduced_decoding else None
+
+    def decode_flags(self, path: str) -> int:
+        # the largest reduction that still leaves the image at least as large as the resize target, in both
+        # orientations since OpenCV applies the EXIF orientation after reading the header size
+        info = self.validator.info(path)
+        if self.decode_size is None or info is None or not info['valid']:
+            return cv2.IMREAD_COLOR
+        target_width, target_height = self.decode_size
+        for factor, flags in REDUCED_DECODE_FLAGS.items():
+            width, height = info['width'] // factor, info['height'] // factor
+            if min(width, height) >= max(target_width, target_height):
+                return flags
+        return cv2.IMREAD_COLOR
+
+    def load_image(self, path: str) -> np.ndarray:
+        # backgrounds from the arena are copied out of the shared memory map, the caller may modify them. The arena
+        # only serves images stored with the flags this run decodes with, so both paths give the same image
+        flags = self.decode_flags(path)
+        if self.arena is not None:
+            image = self.arena.image(path, flags)
+            if image is not None:
+                return image.copy()
+        image = self.cache.get(path, flags)
+        # the fast validation only reads headers, so a file with a valid header can still fail to decode
+        if image is None:
+            raise InvalidGeneratorArgumentException(f"Could not decode source image {path}.")
+        return image
+
+    def image_name(self, index: int) -> str:
+        return f'generated_{index}.{self.writer.image_format}'
+
+    def annotation_output(self) -> str:
+        return None
+
+    def set_seed(self, seed: int):
+        # without a fixed seed a random one is drawn and reported so that the run can be reproduced
+        # a drawn seed gives way to the one of the run that is resumed
+        generatorarguments.check_seed(seed)
+        self.seed_drawn = seed is None
+        if seed is None:
+            seed = random.randrange(2 ** 32)
+        self.seed = seed
+
+    def set_partition(self, num_shards: int, shard_index: int):
+        generatorarguments.check_partition(num_shards, shard_index, self.seed_drawn)
+        self.num_shards = num_shards
+        self.shard_index = shard_index
+
+    def partition_range(self, shard_index: int = None, num_shards: int = None) -> tuple:
+        # contiguous slices of whole batches and output shards, so every node generates exactly the samples
+        # a single run would
+        shard_index = self.shard_index if shard_index is None else shard_index
+        num_shards = self.num_shards if num_shards is None else num_shards
+        alignment = self.alignment()
+        blocks = -(-self.num // alignment)
+        start = shard_index * blocks // num_shards * alignment
+        stop = min((shard_index + 1) * blocks // num_shards * alignment, self.num)
+        return start, stop
+
+    @staticmethod
+    def sample_seed(seed: int, index: int) -> int:
+        return sample_seed(seed, index)
+
+    def seed_sample(self, index: int):
+        seed = Generator.sample_seed(self.seed, index)
+        random.seed(seed)
+        np.random.seed(seed)
+
+    def seed_batch(self, start: int):
+        # the batch augmentations draw from their own stream, seeded by the first index of the batch
+        batch_seed = int(np.random.SeedSequence([self.seed, start, 1]).generate_state(1)[0])
+        random.seed(batch_seed)
+        np.random.seed(batch_seed)
+
+    def counters(self) -> dict:
+        return {
+            'cache_hits': self.cache.hits,
+            'cache_misses': self.cache.misses,
+            'images_written': self.writer.images_written,
+            'bytes_written': self.writer.bytes_written,
+            'blocked_seconds': self.writer.blocked_seconds
+        }
+
+    def add_counters(self, counters: dict):
+        # counters of worker processes are added to the ones of the parent process
+        self.cache.hits += counters['cache_hits']
+        self.cache.misses += counters['cache_misses']
+        self.writer.images_written += counters['images_written']
+        self.writer.bytes_written += counters['bytes_written']
+        self.writer.blocked_seconds += counters['blocked_seconds']
+
+    def report_cache(self):
+        stats = self.cache.stats()
+        print(f'Image cache: {stats["hits"]} hits, {stats["misses"]} misses.')
+
+    def report_writer(self):
+        stats = self.writer.stats()
+        print(f'Writer: {stats["images_written"]} images, {stats["bytes_written"] / (1024 * 1024):.1f} MB written, '
+              f'{stats["blocked_seconds"]:.2f}s blocked on the write queue.')
+
+    @abstractmethod
+    def create_sample(self) -> dict:
+        pass
+
+    @abstractmethod
+    def write_sample(self, index: int, sample: dict):
+        pass
+
+    def augment_sample(self, sample: dict) -> dict:
+        sample['image'], sample['boxes'] = self.pipeline(sample['image'], sample['boxes'])
+        return sample
+
+    @abstractmethod
+    def sample_tuple(self, sample: dict) -> tuple:
+        pass
 
-    def __init__(self, image_source: str, img_output_dir: str, num: int, augment_config: configparser.ConfigParser):
-        super().__init__(image_source, img_output_dir, num, augment_config)
+    def augment_batch(self, indices: range) -> list:
+        samples = []
+        for i in indices:
+            self.seed_sample(i)
+            samples.append(self.create_sample())
+        self.seed_batch(indices[0])
+        boxes = [sample['boxes'] for sample in samples] if samples[0]['boxes'] is not None else None
+        images, boxes = self.pipeline.apply_batch([sample['image'] for sample in samples], boxes)
+        for j in range(len(samples)):
+            samples[j]['image'] = images[j]
+            if boxes is not None:
+                samples[j]['boxes'] = boxes[j]
+        return samples
 
-    def generate(self):
-        for i in range(self.num):
-            image = cv2.imread(Generator.get_random_file(self.image_source))
-            image, _ = augmentapplier.apply(image=image, augment_config=self.augment_config)
-            file_name = os.path.basename(f'{os.path.normpath(self.img_output_dir)}_{str(i)}.jpg')
-            cv2.imwrite(os.path.join(self.img_output_dir, file_name), image)
-            print(file_name)
+    def produce_samples(self, start: int = 0, stop: int = None):
+        # yields (index, sample) for every index from start to stop, or endlessly if stop is None
+        if self.batch_size == 1:
+            for i in (range(start, stop) if stop is not None else itertools.count(start)):
+                self.seed_sample(i)
+                yield i, self.augment_sample(self.create_sample())
+            return
+        batch_starts = range(start, stop, self.batch_size) if stop is not None \
+            else itertools.count(start, self.batch_size)
+        for batch_start in batch_starts:
+            indices = range(batch_start, min(batch_start + self.batch_size, stop) if stop is not None
+                            else batch_start + self.batch_size)
+            yield from zip(indices, self.augment_batch(indices))
+
+    def iter_samples(self, start: int = 0, stop: int = None, infinite: bool = False, prefetch: int = 0):
+        # yields generated samples without writing them to disk, (image, boxes, labels) for detection and
+        # (image, source_path) for classification, by default for the generator's number of images or endlessly
+        # in infinite mode. With prefetch > 0 up to that many samples are produced ahead on a background thread,
+        # which draws from the global random generators, so consumers should not use them while iterating.
+        if not infinite and stop is None:
+            stop = self.num
+        samples = self.produce_samples(start, None if infinite else stop)
+        if prefetch > 0:
+            samples = Prefetcher(samples, prefetch)
+        try:
+            for _, sample in samples:
+                yield self.sample_tuple(sample)
+        finally:
+            if prefetch > 0:
+                samples.close()
+
+    def generate_ranges(self, ranges: list):
+        total = sum(stop - start for start, stop in ranges)
+        done = 0
+        self.writer.open(self.img_output_dir, self.annotation_output())
+        try:
+            for start, stop in ranges:
+                for index, sample in self.produce_samples(start, stop):
+                    self.write_sample(index, sample)
+                    done += 1
+                    self.metrics.progress(done, total)
+        finally:
+            self.writer.close()
+
+    def generate_range(self, start: int, stop: int):
+        self.generate_ranges([(start, stop)])
+
+    def alignment(self) -> int:
+        # ranges start at batch boundaries, so batches are the same for any number of workers and for resumed runs,
+        # and at shard boundaries, so no two processes write into the same shard and shards are always rewritten whole
+        return math.lcm(self.batch_size, self.writer.shard_size) if self.writer.output == 'shards' else self.batch_size
+
+    def generate_parallel(self, ranges: list):
+        total = sum(stop - start for start, stop in ranges)
+        alignment = self.alignment()
+        chunk_size = max(1, -(-total // (self.workers * CHUNKS_PER_WORKER)))
+        chunk_size = -(-chunk_size // alignment) * alignment
+        chunks = [(start, min(start + chunk_size, stop)) for range_start, stop in ranges
+                  for start in range(range_start, stop, chunk_size)]
+        done = 0
+        with multiprocessing.Pool(self.workers, initializer=_init_worker, initargs=(self,)) as pool:
+            for generated, counters, metrics in pool.imap_unordered(_generate_chunk, chunks):
+                self.add_counters(counters)
+                self.metrics.merge(metrics)
+                done += generated
+                self.metrics.progress(done, total)
+
+    def sample_settings(self) -> dict:
+        # settings besides the augmentations and sources that change what the written samples look like
+        return {
+            'reduced_decoding': self.reduced_decoding,
+            'jpeg_quality': self.writer.jpeg_quality,
+            'png_compression': self.writer.png_compression,
+            'webp_quality': self.writer.webp_quality
+        }
+
+    def config_hash(self) -> str:
+        # hash of everything that decides the content of the samples, the number of images is left out so that a
+        # finished run can be extended
+        config = {
+            'augmentations': {section: dict(self.augment_config.items(section))
+                              for section in self.augment_config.sections() if section != 'generator'},
+            'backgrounds': self.catalog.backgrounds,
+            'objects': self.catalog.objects,
+            'class_weights': self.catalog.class_weights,
+            'settings': self.sample_settings()
+        }
+        return hashlib.sha256(json.dumps(config, sort_keys=True).encode('utf-8')).hexdigest()
+
+    def manifest_header(self) -> dict:
+        return {
+            'seed': self.seed,
+            'image_format': self.writer.image_format,
+            'output': self.writer.output,
+            'shard_size': self.writer.shard_size,
+            'batch_size': self.batch_size,
+            'config': self.config_hash()
+        }
+
+    def pending_ranges(self) -> list:
+        # ranges of indices the resumed run still has to generate, whole batches and shards are generated again
+        # if any of their samples is missing
+        part_start, part_stop = self.partition_range()
+        header, records = self.manifest.load()
+        if header is None:
+            self.manifest.start(self.manifest_header())
+            return [(part_start, part_stop)] if part_stop > part_start else []
+        if header['seed'] != self.seed:
+            if not self.seed_drawn:
+                raise InvalidGeneratorArgumentException(
+                    f"Seed {self.seed} does not match the seed {header['seed']} of the run to resume.")
+            self.seed = header['seed']
+        for key, value in self.manifest_header().items():
+            if key == 'config' and header.get(key) != value:
+                raise InvalidGeneratorArgumentException(
+                    "The augmentations, sources or output settings changed since the run to resume was started.")
+            if header.get(key) != value:
+                raise InvalidGeneratorArgumentException(
+                    f"Setting {key} = {value} does not match {header.get(key)} of the run to resume.")
+        done = [index in records and RunManifest.complete(records[index]) for index in range(part_start, part_stop)]
+        alignment = self.alignment()
+        ranges = []
+        for start in range(part_start, part_stop, alignment):
+            stop = min(start + alignment, part_stop)
+            if all(done[start - part_start:stop - part_start]):
+                continue
+            if ranges and ranges[-1][1] == start:
+                ranges[-1] = (ranges[-1][0], stop)
+            else:
+                ranges.append((start, stop))
+        print(f'Resuming run, {sum(done)} of {len(done)} images already generated.')
+        return ranges
+
+    def start_output(self, resume: bool):
+        pass
+
+    def merge_output(self, num_shards: int):
+        pass
+
+    def merge_partitions(self, num_shards: int):
+        # checks that every node of a split run generated its whole slice, then combines their manifests and
+        # annotations into the ones a single run would have written
+        if self.manifest is None:
+            raise InvalidGeneratorArgumentException("Merging shards requires a run manifest.")
+        nodes = [RunManifest(RunManifest.node_path(self.manifest.path, i, num_shards)) for i in range(num_shards)]
+        header = None
+        records = []
+        for shard_index, node in enumerate(nodes):
+            node_header, node_records = node.load()
+            if node_header is None:
+                raise InvalidGeneratorArgumentException(f"No manifest of shard {shard_index} found at {node.path}.")
+            if header is not None and node_header != header:
+                raise InvalidGeneratorArgumentException(f"Shard {shard_index} was generated with other settings than "
+                                                        f"shard 0.")
+            header = node_header
+            start, stop = self.partition_range(shard_index, num_shards)
+            missing = [index for index in range(start, stop)
+                       if index not in node_records or not RunManifest.complete(node_records[index])]
+            if len(missing) > 0:
+                raise InvalidGeneratorArgumentException(f"Shard {shard_index} is missing {len(missing)} of its "
+                                                        f"{stop - start} images, resume it before merging.")
+            records += [node_records[index] for index in range(start, stop)]
+        self.manifest.write(header, records)
+        self.merge_output(num_shards)
+        for node in nodes:
+            # never remove the merged manifest itself
+            if node.path != self.manifest.path:
+                os.remove(node.path)
+        print(f'Merged {num_shards} shards with {len(records)} images.')
+
+    def finish_output(self):
+        pass
+
+    def generate(self, resume: bool = False):
+        if resume and self.manifest is None:
+            raise InvalidGeneratorArgumentException("Resuming a run requires a run manifest.")
+        start, stop = self.partition_range()
+        ranges = [(start, stop)] if stop > start else []
+        if resume:
+            ranges = self.pending_ranges()
+        elif self.manifest is not None:
+            self.manifest.start(self.manifest_header())
+        total = sum(stop - start for start, stop in ranges)
+        print(f'Generating {total} images with seed {self.seed} using {self.workers} worker(s).')
+        self.metrics.reset()
+        self.start_output(resume)
+        if self.workers > 1 and total > 1:
+            self.generate_parallel(ranges)
+        else:
+            self.generate_ranges(ranges)
+        self.finish_output()
+        if self.manifest is not None:
+            self.manifest.compact()
         print('Generating finished.')
+        self.report_cache()
+        self.report_writer()
+        self.metrics.report(self.counters())
+
+
+class ClassificationGenerator(Generator):
+
+    def __init__(self, image_source: str, img_output_dir: str, num: int, augment_config: configparser.ConfigParser,
+                 cache: ImageCache = None, workers: int = 1, seed: int = None, catalog: SourceCatalog = None,
+                 validator: SourceValidator = None, batch_size: int = 1, writer: AsyncWriter = None,
+                 metrics: Metrics = None, manifest: RunManifest = None, arena: SourceArena = None,
+                 reduced_decoding: bool = True, num_shards: int = 1, shard_index: int = 0):
+        super().__init__(image_source, img_output_dir, num, augment_config, cache, workers, seed, validator,
+                         batch_size, writer, metrics, manifest, arena, reduced_decoding, num_shards, shard_index)
+        self.set_catalog(catalog)
+
+    def build_catalog(self) -> SourceCatalog:
+        return SourceCatalog.scan(self.image_source)
+
+    def create_sample(self) -> dict:
+        source = self.catalog.random_background()
+        with self.metrics.stage('read'):
+            image = self.load_image(source)
+        return {'image': image, 'boxes': None, 'source': source}
+
+    def sample_tuple(self, sample: dict) -> tuple:
+        return sample['image'], sample['source']
+
+    def image_name(self, index: int) -> str:
+        return os.path.basename(f'{os.path.normpath(self.img_output_dir)}_{str(index)}.{self.writer.image_format}')
+
+    def write_sample(self, index: int, sample: dict):
+        file_name = self.image_name(index)
+        image = sample['image']
+        # classification images only get an annotation record when written into shards
+        self.writer.submit(index, file_name, image, lambda: (file_name[0:file_name.index('.')] + '.json', json.dumps({
+            'image_name': file_name,
+            'image_width': image[0].__len__(),
+            'image_height': image.__len__(),
+            'source': sample['source']
+        })))
 
 
 '''
@@ -90,83 +541,169 @@ Additionally the resulting images will be augmented and annotated in different f
 class DetectionGenerator(Generator):
 
     def __init__(self, image_source: str, object_source: str, num: int, img_output_dir: str, annotation_format: str,
-                 annotation_output_dir: str, max_objects: int, augment_config: configparser.ConfigParser):
-        super().__init__(image_source, img_output_dir, num, augment_config)
+                 annotation_output_dir: str, max_objects: int, augment_config: configparser.ConfigParser,
+                 blend_mode: str = 'mask', feather: int = 0, max_iou: float = 1.0, max_occlusion: float = 1.0,
+                 placement_attempts: int = 20, cache: ImageCache = None, workers: int = 1, seed: int = None, catalog: SourceCatalog = None, validator: SourceValidator = None,
+                 batch_size: int = 1, writer: AsyncWriter = None, metrics: Metrics = None,
+                 manifest: RunManifest = None, arena: SourceArena = None,
+                 reduced_decoding: bool = True, num_shards: int = 1, shard_index: int = 0):
+        super().__init__(image_source, img_output_dir, num, augment_config, cache, workers, seed, validator,
+                         batch_size, writer, metrics, manifest, arena, reduced_decoding, num_shards, shard_index)
         self.set_objects_source(object_source)
         self.set_annotation_format(annotation_format)
         self.set_annotation_output_dir(annotation_output_dir)
         self.set_max_objects(max_objects)
+        self.set_blend_mode(blend_mode)
+        self.set_feather(feather)
+        self.set_placement(max_iou, max_occlusion, placement_attempts)
+        self.set_catalog(catalog)
+        self.set_annotation_stream()
+
+    def build_catalog(self) -> SourceCatalog:
+        return SourceCatalog.scan(self.image_source, self.objects_source)
+
+    def compile_pipeline(self, augment_config: configparser.ConfigParser) -> augmentapplier.AugmentPipeline:
+        return augmentapplier.compile(augment_config, with_boxes=True)
+
+    def set_catalog(self, catalog: SourceCatalog):
+        super().set_catalog(catalog)
+        self.catalog.check_objects(self.validator)
+        self.validator.save()
 
-    @staticmethod
-    def dir_contains_only_pngs(dir: str) -> bool:
-        if Generator.dir_contains_only_imgs(dir):
-            for file in os.listdir(dir):
-                img = cv2.imread(os.path.join(dir, file), cv2.IMREAD_UNCHANGED)
-                # real PNG images have a shape of (x,x,4)
-                if img.shape[2] != 4:
-                    return False
-            return True
-        return False
-    
     def set_objects_source(self, objects_source: str):
-        if not Generator.valid_dir(objects_source):
-            raise InvalidGeneratorArgumentException("Object source directory not a real directory or is empty.")
-        for dir in os.listdir(objects_source):
-            path = os.path.join(objects_source, dir)
-            if not Generator.valid_dir(path):
-                raise InvalidGeneratorArgumentException("Found invalid or empty sub-directory in object source.")
-            if not DetectionGenerator.dir_contains_only_pngs(path):
-                raise InvalidGeneratorArgumentException("Found invalid png image in object source sub-directory.")
+        generatorarguments.check_objects_source(objects_source)
         self.objects_source = objects_source
 
     def set_annotation_format(self, annotation_format):
-        if not annotation_format.lower() in annotationwriters.ACCEPTED_ANNOTATION_FORMATS:
-            raise InvalidGeneratorArgumentException("Specified annotation format not a valid format, accepted formats are xml & json")
-        self.annotation_format = annotation_format
+        generatorarguments.check_annotation_format(annotation_format)
+        self.annotation_format = annotation_format.lower()
+
+    def annotation_output(self) -> str:
+        return self.annotation_output_dir
+
+    def sample_settings(self) -> dict:
+        settings = super().sample_settings()
+        settings.update({
+            'annotation_format': self.annotation_format,
+            'max_objects': self.max_objects,
+            'blend_mode': self.blend_mode,
+            'feather': self.feather,
+            'max_iou': self.max_iou,
+            'max_occlusion': self.max_occlusion,
+            'placement_attempts': self.placement_attempts
+        })
+        return settings
+
+    def set_annotation_stream(self):
+        # coco and jsonl collect the annotations of all images in one file
+        self.writer.stream = annotationwriters.AnnotationStream(
+            self.annotation_output_dir, self.annotation_format, self.catalog.classes,
+            annotationwriters.AnnotationStream.node_records_file(self.shard_index, self.num_shards)) \
+            if self.annotation_format in annotationwriters.STREAMED_ANNOTATION_FORMATS else None
+
+    def start_output(self, resume: bool):
+        if self.annotation_format == 'yolo':
+            annotationwriters.write_classes(self.catalog.classes, self.annotation_output_dir)
+        if self.writer.stream is not None and not resume:
+            self.writer.stream.reset()
+
+    def finish_output(self):
+        if self.writer.stream is not None:
+            self.writer.stream.finish()
+
+    def merge_output(self, num_shards: int):
+        if self.writer.stream is not None:
+            self.writer.stream.merge_nodes(num_shards)
 
     def set_annotation_output_dir(self, output_dir: str):
-        if not os.path.isdir(output_dir):
-            raise InvalidGeneratorArgumentException("No directory found under specified annotation-output-path.")
+        generatorarguments.check_annotation_output_dir(output_dir)
         self.annotation_output_dir = output_dir
 
     def set_max_objects(self, max_objects: int):
-        if max_objects < 1:
-            raise InvalidGeneratorArgumentException("Numbe  r of max objects per image must be at least 1.")
+        generatorarguments.check_max_objects(max_objects)
         self.max_objects = max_objects
 
+    def set_blend_mode(self, blend_mode: str):
+        generatorarguments.check_blend_mode(blend_mode)
+        self.blend_mode = blend_mode.lower()
+
+    def set_feather(self, feather: int):
+        generatorarguments.check_feather(feather)
+        self.feather = feather
+
+    def set_placement(self, max_iou: float, max_occlusion: float, attempts: int):
+        generatorarguments.check_placement(max_iou, max_occlusion, attempts)
+        self.max_iou = max_iou
+        self.max_occlusion = max_occlusion
+        self.placement_attempts = attempts
+
     def get_random_objects(self) -> tuple:
         objects = []
         labels = []
-        dir_list = os.listdir(self.objects_source)
         for i in range(random.randint(1, self.max_objects)):
-            idx = random.randint(0, len(dir_list) - 1)
-            class_dir = os.path.join(self.objects_source, dir_list[idx])
-            images = os.listdir(class_dir)
-            objects.append(os.path.join(class_dir, images[random.randint(0, len(images) - 1)]))
-            labels.append(dir_list[idx])
+            obj, label = self.catalog.random_object()
+            objects.append(obj)
+            labels.append(label)
         return objects, labels
 
-    def create_image(self, image, objects) :
-        boxes = []
-        image = cv2.imread(image)
-        # copy paster objects onto background image
-        for obj in objects:
-            obj_image = cv2.imread(obj, cv2.IMREAD_UNCHANGED)
-            image, box = BoxAugmentations.overlay_object(image, obj_image)
-            boxes.append(box)   
-        image, boxes = augmentapplier.apply(image=image, boxes=boxes, augment_config=self.augment_config)
-        img_width = image[0].__len__()
-        img_height = image.__len__()
-        return image, boxes, img_width, img_height
-
-    def generate(self):
-        for i in range(self.num):
-            image = Generator.get_random_file(self.image_source) 
-            obj_images, labels = self.get_random_objects()
-            image, boxes, img_width, img_height = self.create_image(image, obj_images)
-            img_path = f'{self.img_output_dir}generated_{i}.jpg'
-            cv2.imwrite(img_path, image)
-            annotationwriters.write_annotations(self.annotation_format, img_path, img_width,
-                                                img_height, labels, boxes, self.annotation_output_dir)
-            print(img_path)
-        print('Generating finished.')
+    def sprite_sources(self) -> list:
+        return [obj for label in self.catalog.classes for obj in self.catalog.objects[label]]
+
+    def load_sprite(self, path: str) -> SpritePyramid:
+        # sprites are cropped and downscaled into pyramids once, then shared through the arena or the cache
+        if self.arena is not None:
+            pyramid = self.arena.pyramid(path)
+            if pyramid is not None:
+                return pyramid
+        pyramid = self.cache.get_derived((path, 'pyramid'), lambda: SpritePyramid.load(path))
+        if pyramid is None:
+            raise InvalidGeneratorArgumentException(f"Could not decode object image {path}.")
+        return pyramid
+
+    def compose_image(self, image, objects) -> tuple:
+        with self.metrics.stage('read'):
+            image = self.load_image(image)
+            obj_images = [self.load_sprite(obj) for obj in objects]
+            if self.decode_size is not None and (image.shape[1], image.shape[0]) != self.decode_size:
+                # objects are pasted at the size the pipeline resizes to, which then leaves the image as it is
+                image = cv2.resize(image, self.decode_size, interpolation=cv2.INTER_AREA)
+        with self.metrics.stage('overlay'):
+            placement = PlacementEngine(image[0].__len__(), image.__len__(), self.max_iou, self.max_occlusion,
+                                        self.placement_attempts)
+            return BoxAugmentations.overlay_objects(image, obj_images, self.blend_mode, self.feather, placement)
+
+    def create_sample(self) -> dict:
+        source = self.catalog.random_background()
+        obj_images, labels = self.get_random_objects()
+        image, boxes = self.compose_image(source, obj_images)
+        # objects without a valid position are left out together with their labels
+        labels = [label for label, box in zip(labels, boxes) if box is not None]
+        boxes = [box for box in boxes if box is not None]
+        return {'image': image, 'boxes': boxes, 'labels': labels, 'source': source}
+
+    @staticmethod
+    def drop_empty_boxes(sample: dict) -> dict:
+        # crops and rotations can move objects out of the image, their boxes and labels are removed
+        kept = [i for i, box in enumerate(sample['boxes']) if box['x1'] > box['x0'] and box['y1'] > box['y0']]
+        if len(kept) < len(sample['boxes']):
+            sample['boxes'] = [sample['boxes'][i] for i in kept]
+            sample['labels'] = [sample['labels'][i] for i in kept]
+        return sample
+
+    def augment_sample(self, sample: dict) -> dict:
+        return DetectionGenerator.drop_empty_boxes(super().augment_sample(sample))
+
+    def augment_batch(self, indices: range) -> list:
+        return [DetectionGenerator.drop_empty_boxes(sample) for sample in super().augment_batch(indices)]
+
+    def sample_tuple(self, sample: dict) -> tuple:
+        return sample['image'], sample['boxes'], sample['labels']
+
+    def write_sample(self, index: int, sample: dict):
+        image = sample['image']
+        img_path = f'{self.img_output_dir}{self.image_name(index)}'
+        # the annotation is rendered by the writer thread
+        self.writer.submit(index, self.image_name(index), image, lambda: (
+            annotationwriters.annotation_name(img_path, self.annotation_format),
+            annotationwriters.render_annotations(self.annotation_format, img_path, image[0].__len__(), image.__len__(),
+                                                 sample['labels'], sample['boxes'], self.catalog.classes, index)))
@@ -0,0 +1,74 @@
+from collections import OrderedDict
+import cv2
+import numpy as np
+
+'''
+This class keeps decoded images in memory so that source files drawn again do not have to be decoded again.
+Entries are evicted in least-recently-used order once the total size of all cached images exceeds the byte budget.
+'''
+
+
+class ImageCache:
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.entries = OrderedDict()
+
+    def __getstate__(self) -> dict:
+        # worker processes started by spawn begin with an empty cache of the same budget instead of a copy of every
+        # cached image
+        state = dict(self.__dict__)
+        state['entries'] = OrderedDict()
+        state['current_bytes'] = 0
+        return state
+
+    def get(self, path: str, flags: int = cv2.IMREAD_COLOR, copy: bool = True) -> np.ndarray:
+        key = (path, flags)
+        image = self.entries.get(key)
+        if image is not None:
+            self.hits += 1
+            self.entries.move_to_end(key)
+        else:
+            self.misses += 1
+            image = cv2.imread(path, flags)
+            if image is None:
+                return None
+            self.put(key, image)
+        # cached images are read-only, callers that modify images must ask for their own copy
+        return image.copy() if copy else image
+
+    def get_derived(self, key: tuple, build):
+        # entries computed from source files, like sprite pyramids, are cached under their own key and count
+        # towards the same byte budget, build is only called on a miss
+        entry = self.entries.get(key)
+        if entry is not None:
+            self.hits += 1
+            self.entries.move_to_end(key)
+            return entry
+        self.misses += 1
+        entry = build()
+        if entry is not None:
+            self.put(key, entry)
+        return entry
+
+    def put(self, key: tuple, image: np.ndarray):
+        if image.nbytes > self.max_bytes:
+            return
+        if isinstance(image, np.ndarray):
+            image.flags.writeable = False
+        self.entries[key] = image
+        self.current_bytes += image.nbytes
+        while self.current_bytes > self.max_bytes:
+            _, evicted = self.entries.popitem(last=False)
+            self.current_bytes -= evicted.nbytes
+
+    def stats(self) -> dict:
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'entries': len(self.entries),
+            'bytes': self.current_bytes
+        }
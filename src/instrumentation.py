@@ -0,0 +1,156 @@
+import contextlib
+import json
+import threading
+import time
+
+METRICS_FORMATS = ['json', 'prometheus']
+
+# returned by disabled metrics instead of a timer, so that timing a stage costs almost nothing
+NULL_STAGE = contextlib.nullcontext()
+
+'''
+This class collects the time spent in each stage of a run (reading sources, pasting objects, every augmentation,
+encoding, writing) and reports the progress of the run in intervals.
+At the end of a run a summary is printed and can be written as JSON or as a Prometheus textfile.
+'''
+
+
+class StageTimer:
+
+    def __init__(self, metrics, name: str):
+        self.metrics = metrics
+        self.name = name
+        self.start = 0.0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.metrics.add_time(self.name, time.perf_counter() - self.start)
+        return False
+
+
+class Metrics:
+
+    def __init__(self, enabled: bool = False, progress_interval: float = 10.0, output: str = None,
+                 output_format: str = 'json'):
+        self.enabled = enabled
+        self.progress_interval = progress_interval
+        self.output = output
+        self.output_format = output_format
+        self.lock = threading.Lock()
+        self.reset()
+
+    def __getstate__(self) -> dict:
+        # worker processes started by spawn get the metrics pickled, each with its own lock
+        state = dict(self.__dict__)
+        del state['lock']
+        return state
+
+    def __setstate__(self, state: dict):
+        self.__dict__.update(state)
+        self.lock = threading.Lock()
+
+    def reset(self):
+        self.timers = {}
+        self.counts = {}
+        self.start_time = time.perf_counter()
+        self.last_report = self.start_time
+        self.done = 0
+
+    def stage(self, name: str):
+        if not self.enabled:
+            return NULL_STAGE
+        return StageTimer(self, name)
+
+    def add_time(self, name: str, seconds: float, calls: int = 1):
+        # stages are timed by the generating thread and the writer threads at the same time
+        with self.lock:
+            timer = self.timers.setdefault(name, [0.0, 0])
+            timer[0] += seconds
+            timer[1] += calls
+
+    def count(self, name: str, value: int = 1):
+        if not self.enabled:
+            return
+        with self.lock:
+            self.counts[name] = self.counts.get(name, 0) + value
+
+    def snapshot(self) -> dict:
+        with self.lock:
+            return {'timers': {name: list(timer) for name, timer in self.timers.items()}, 'counts': dict(self.counts)}
+
+    def merge(self, snapshot: dict):
+        # adds the metrics collected by a worker process
+        for name, (seconds, calls) in snapshot['timers'].items():
+            self.add_time(name, seconds, calls)
+        with self.lock:
+            for name, value in snapshot['counts'].items():
+                self.counts[name] = self.counts.get(name, 0) + value
+
+    def progress(self, done: int, total: int):
+        self.done = done
+        if self.progress_interval is None or self.progress_interval <= 0:
+            return
+        now = time.perf_counter()
+        if now - self.last_report < self.progress_interval and done != total:
+            return
+        self.last_report = now
+        elapsed = now - self.start_time
+        rate = done / elapsed if elapsed > 0 else 0.0
+        eta = (total - done) / rate if rate > 0 else float('inf')
+        print(f'{done}/{total} images ({100 * done / total if total else 100:.1f}%), {rate:.1f} images/sec, '
+              f'ETA {eta:.0f}s')
+
+    def summary(self, counters: dict = None) -> dict:
+        elapsed = time.perf_counter() - self.start_time
+        snapshot = self.snapshot()
+        return {
+            'images': self.done,
+            'elapsed_seconds': elapsed,
+            'images_per_sec': self.done / elapsed if elapsed > 0 else 0.0,
+            'stages': {name: {'seconds': seconds, 'calls': calls}
+                       for name, (seconds, calls) in sorted(snapshot['timers'].items())},
+            'counts': snapshot['counts'],
+            'counters': counters if counters is not None else {}
+        }
+
+    @staticmethod
+    def prometheus(summary: dict) -> str:
+        lines = [
+            '# HELP datasetgen_images_total Images generated by the run.',
+            '# TYPE datasetgen_images_total counter',
+            f'datasetgen_images_total {summary["images"]}',
+            '# HELP datasetgen_elapsed_seconds Duration of the run.',
+            '# TYPE datasetgen_elapsed_seconds gauge',
+            f'datasetgen_elapsed_seconds {summary["elapsed_seconds"]}',
+            '# HELP datasetgen_images_per_second Throughput of the run.',
+            '# TYPE datasetgen_images_per_second gauge',
+            f'datasetgen_images_per_second {summary["images_per_sec"]}',
+            '# HELP datasetgen_stage_seconds_total Time spent in a stage, summed over all threads and processes.',
+            '# TYPE datasetgen_stage_seconds_total counter'
+        ]
+        lines += [f'datasetgen_stage_seconds_total{{stage="{name}"}} {stage["seconds"]}'
+                  for name, stage in summary['stages'].items()]
+        lines += ['# HELP datasetgen_stage_calls_total Number of times a stage ran.',
+                  '# TYPE datasetgen_stage_calls_total counter']
+        lines += [f'datasetgen_stage_calls_total{{stage="{name}"}} {stage["calls"]}'
+                  for name, stage in summary['stages'].items()]
+        for name, value in {**summary['counts'], **summary['counters']}.items():
+            lines += [f'# TYPE datasetgen_{name} gauge', f'datasetgen_{name} {value}']
+        return '\n'.join(lines) + '\n'
+
+    def report(self, counters: dict = None):
+        summary = self.summary(counters)
+        if self.enabled:
+            for name, stage in summary['stages'].items():
+                print(f'{name:<30} {stage["seconds"]:10.2f}s {stage["calls"]:10d} calls')
+        print(f'{summary["images"]} images in {summary["elapsed_seconds"]:.1f}s ({summary["images_per_sec"]:.1f} images/sec).')
+        if self.output is None:
+            return
+        with open(self.output, 'w') as outfile:
+            if self.output_format == 'prometheus':
+                outfile.write(Metrics.prometheus(summary))
+            else:
+                json.dump(summary, outfile, indent=4)
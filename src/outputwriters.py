@@ -0,0 +1,287 @@
+import functools
+import hashlib
+import io
+import json
+import os
+import queue
+import tarfile
+import threading
+import time
+import numpy as np
+from instrumentation import NULL_STAGE
+
+IMAGE_FORMATS = ['jpg', 'png', 'webp']
+OUTPUT_TYPES = ['files', 'shards']
+
+'''
+This class writes every sample as its own files, the image into the image output directory and its annotation,
+if there is one, into the annotation output directory.
+'''
+
+
+class FileSink:
+
+    def __init__(self, img_output_dir: str, annotation_output_dir: str = None):
+        self.img_output_dir = img_output_dir
+        self.annotation_output_dir = annotation_output_dir
+        # without an annotation directory annotations are not rendered at all
+        self.annotations = annotation_output_dir is not None
+        # streamed annotation records only go into the records of the run, not into one file per image
+        self.records = False
+
+    def write(self, index: int, image_name: str, data: bytes, annotation: tuple = None, sequence: int = 0) -> int:
+        with open(os.path.join(self.img_output_dir, image_name), 'wb') as outfile:
+            outfile.write(data)
+        size = len(data)
+        if annotation is not None:
+            annotation_name, text = annotation
+            encoded = text.encode('utf-8')
+            with open(os.path.join(self.annotation_output_dir, annotation_name), 'wb') as outfile:
+                outfile.write(encoded)
+            size += len(encoded)
+        return size
+
+    def paths(self, index: int, image_name: str, annotation: tuple = None) -> list:
+        paths = [os.path.join(self.img_output_dir, image_name)]
+        if annotation is not None:
+            paths.append(os.path.join(self.annotation_output_dir, annotation[0]))
+        return paths
+
+    def close(self):
+        pass
+
+
+'''
+This class streams samples into tar shards instead of writing one file per image and annotation.
+Sample i goes into shard i // shard_size, where it is stored as its image and its annotation record under the same
+key. Every shard gets an index file next to it with the offset and size of each member, so single samples can be
+read without scanning the shard.
+'''
+
+
+class ShardSink:
+
+    def __init__(self, output_dir: str, shard_size: int):
+        self.output_dir = output_dir
+        self.shard_size = shard_size
+        self.lock = threading.Lock()
+        # open shards by shard number, writer threads may still be writing into the previous shard
+        self.shards = {}
+        self.annotations = True
+        # streamed annotation records are also stored in the shard, next to their image
+        self.records = True
+        # samples finished out of order by the writer threads wait here, so that members are added in index order
+        # and identical runs write identical shards
+        self.pending = {}
+        self.next_sequence = 0
+
+    def shard_path(self, shard: int) -> str:
+        return os.path.join(self.output_dir, f'shard-{shard:06d}.tar')
+
+    def finish_shard(self, shard: int):
+        tar, index, _ = self.shards.pop(shard)
+        tar.close()
+        with open(self.shard_path(shard)[:-len('.tar')] + '.idx.json', 'w') as outfile:
+            json.dump(index, outfile)
+
+    @staticmethod
+    def add_member(tar: tarfile.TarFile, index: dict, key: str, name: str, data: bytes):
+        info = tarfile.TarInfo(name)
+        info.size = len(data)
+        tar.addfile(info, io.BytesIO(data))
+        # the member data ends at the current offset, padded to whole tar blocks
+        padded = -(-len(data) // tarfile.BLOCKSIZE) * tarfile.BLOCKSIZE
+        index.setdefault(key, {})[name] = [tar.offset - padded, len(data)]
+
+    def add_sample(self, index: int, image_name: str, data: bytes, annotation: tuple):
+        key = image_name[0:image_name.index('.')]
+        shard = index // self.shard_size
+        if shard not in self.shards:
+            self.shards[shard] = [tarfile.open(self.shard_path(shard), 'w', format=tarfile.USTAR_FORMAT), {}, 0]
+        tar, shard_index, count = self.shards[shard]
+        ShardSink.add_member(tar, shard_index, key, image_name, data)
+        if annotation is not None:
+            ShardSink.add_member(tar, shard_index, key, annotation[0], annotation[1])
+        self.shards[shard][2] = count + 1
+        if count + 1 == self.shard_size:
+            self.finish_shard(shard)
+
+    def write(self, index: int, image_name: str, data: bytes, annotation: tuple = None, sequence: int = 0) -> int:
+        size = len(data)
+        if annotation is not None:
+            annotation = (annotation[0], annotation[1].encode('utf-8'))
+            size += len(annotation[1])
+        with self.lock:
+            self.pending[sequence] = (index, image_name, data, annotation)
+            while self.next_sequence in self.pending:
+                self.add_sample(*self.pending.pop(self.next_sequence))
+                self.next_sequence += 1
+        return size
+
+    def paths(self, index: int, image_name: str, annotation: tuple = None) -> list:
+        # the index file is only written once the shard is complete
+        shard_path = self.shard_path(index // self.shard_size)
+        return [shard_path, shard_path[:-len('.tar')] + '.idx.json']
+
+    def close(self):
+        with self.lock:
+            # samples behind one that failed to write are still added
+            for sequence in sorted(self.pending):
+                self.add_sample(*self.pending.pop(sequence))
+            for shard in list(self.shards):
+                self.finish_shard(shard)
+
+
+'''
+This class encodes and writes generated images on background threads, so that generating the next image overlaps
+with encoding and writing the previous ones. Images are handed over through a bounded queue, which blocks the
+generator when the writer threads fall behind. Annotations can be passed along as a function returning the
+annotation file name and its content, which is called by the writer thread. Samples are written as single files or
+into tar shards, depending on the output type.
+'''
+
+
+class AsyncWriter:
+
+    def __init__(self, threads: int = 2, queue_size: int = 64, image_format: str = 'jpg', jpeg_quality: int = 95,
+                 png_compression: int = 3, webp_quality: int = 90, output: str = 'files', shard_size: int = 1000):
+        self.threads = threads
+        self.queue_size = queue_size
+        self.image_format = image_format
+        self.jpeg_quality = jpeg_quality
+        self.png_compression = png_compression
+        self.webp_quality = webp_quality
+        self.output = output
+        self.shard_size = shard_size
+        self.sink = None
+        # set by the generator to time encoding and writing and to record the written samples
+        self.metrics = None
+        self.manifest = None
+        # set by the generator for annotation formats that are collected in one file
+        self.stream = None
+        self.sequence = 0
+        self.bytes_written = 0
+        self.images_written = 0
+        self.blocked_seconds = 0.0
+        self.queue = None
+        self.workers = []
+        self.lock = None
+        self.error = None
+
+    def encode_params(self) -> list:
+        # OpenCV is imported on the first encode, so that checking a config does not load it
+        import cv2
+        match self.image_format:
+            case 'jpg':
+                return [cv2.IMWRITE_JPEG_QUALITY, self.jpeg_quality]
+            case 'png':
+                return [cv2.IMWRITE_PNG_COMPRESSION, self.png_compression]
+            case 'webp':
+                return [cv2.IMWRITE_WEBP_QUALITY, self.webp_quality]
+
+    def encode(self, image: np.ndarray) -> bytes:
+        import cv2
+        success, buffer = cv2.imencode('.' + self.image_format, image, self.encode_params())
+        if not success:
+            raise ValueError(f'Could not encode image as {self.image_format}.')
+        return buffer.tobytes()
+
+    def write(self, index: int, image_name: str, image: np.ndarray, annotation=None, sequence: int = 0):
+        with self.stage('encode'):
+            data = self.encode(image)
+        if annotation is not None and (self.sink.annotations or self.stream is not None):
+            with self.stage('annotate'):
+                annotation = annotation()
+        else:
+            annotation = None
+        record = None
+        if annotation is not None and self.stream is not None:
+            # streamed annotations go into the records of the run, and only into sinks that store them per sample
+            record = annotation[1]
+            if not self.sink.records:
+                annotation = None
+        with self.stage('write'):
+            size = self.sink.write(index, image_name, data, annotation, sequence)
+        written = None
+        if self.manifest is not None:
+            written = functools.partial(self.manifest.record, index, self.sink.paths(index, image_name, annotation),
+                                        hashlib.sha256(data).hexdigest())
+        if record is not None:
+            self.stream.add(sequence, record, written)
+        elif written is not None:
+            written()
+        with self.lock:
+            self.bytes_written += size
+            self.images_written += 1
+
+    def stage(self, name: str):
+        return self.metrics.stage(name) if self.metrics is not None else NULL_STAGE
+
+    def run(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                return
+            try:
+                self.write(*item)
+            except Exception as exc:
+                self.error = exc
+
+    def open(self, img_output_dir: str, annotation_output_dir: str = None):
+        # threads and shards are started per run, so that every worker process gets its own ones
+        self.lock = threading.Lock()
+        self.error = None
+        if self.output == 'shards':
+            self.sink = ShardSink(img_output_dir, self.shard_size)
+        else:
+            self.sink = FileSink(img_output_dir, annotation_output_dir)
+        if self.manifest is not None:
+            self.manifest.open()
+        if self.stream is not None:
+            self.stream.open()
+        self.sequence = 0
+        if self.threads == 0:
+            return
+        self.queue = queue.Queue(self.queue_size)
+        self.workers = [threading.Thread(target=self.run, daemon=True) for _ in range(self.threads)]
+        for worker in self.workers:
+            worker.start()
+
+    def submit(self, index: int, image_name: str, image: np.ndarray, annotation=None):
+        if self.error is not None:
+            raise self.error
+        # the submission order lets streamed annotations be written in order by several threads
+        sequence = self.sequence
+        self.sequence += 1
+        if self.threads == 0:
+            self.write(index, image_name, image, annotation, sequence)
+            return
+        start = time.perf_counter()
+        self.queue.put((index, image_name, image, annotation, sequence))
+        self.blocked_seconds += time.perf_counter() - start
+
+    def close(self):
+        if self.threads != 0:
+            for _ in self.workers:
+                self.queue.put(None)
+            for worker in self.workers:
+                worker.join()
+            self.workers = []
+            self.queue = None
+        self.sink.close()
+        self.sink = None
+        # the stream records the samples of its remaining records in the manifest, so it is closed first
+        if self.stream is not None:
+            self.stream.close()
+        if self.manifest is not None:
+            self.manifest.close()
+        self.lock = None
+        if self.error is not None:
+            raise self.error
+
+    def stats(self) -> dict:
+        return {
+            'images_written': self.images_written,
+            'bytes_written': self.bytes_written,
+            'blocked_seconds': self.blocked_seconds
+        }
@@ -0,0 +1,82 @@
+import random
+
+'''
+This class decides where the objects of one image are pasted. Boxes that were already placed are kept in a uniform
+grid, so checking a candidate position only looks at the boxes in the grid cells it covers instead of all of them.
+A position is rejected if its IoU with a placed box exceeds max_iou, or if it would hide more than max_occlusion
+of the area of a placed box, counting everything that was pasted on top of that box so far. Objects are clamped
+to the background, and an object for which no valid position is found within the attempts is not placed at all.
+'''
+
+
+class PlacementEngine:
+
+    def __init__(self, width: int, height: int, max_iou: float = 1.0, max_occlusion: float = 1.0, attempts: int = 20,
+                 cell_size: int = None):
+        self.width = width
+        self.height = height
+        self.max_iou = max_iou
+        self.max_occlusion = max_occlusion
+        self.attempts = attempts
+        # objects are at most a quarter of the smaller background side, so a box covers only a few cells
+        self.cell_size = cell_size if cell_size is not None else max(1, min(width, height) // 8)
+        self.grid = {}
+        self.boxes = []
+        # area of every placed box hidden by later objects, summed over the objects
+        self.covered = []
+
+    def constrained(self) -> bool:
+        return self.max_iou < 1.0 or self.max_occlusion < 1.0
+
+    def cells(self, box: tuple):
+        x0, y0, x1, y1 = box
+        for cell_x in range(x0 // self.cell_size, (x1 - 1) // self.cell_size + 1):
+            for cell_y in range(y0 // self.cell_size, (y1 - 1) // self.cell_size + 1):
+                yield cell_x, cell_y
+
+    def overlaps(self, box: tuple) -> list:
+        # returns (box id, intersection area) for every placed box the candidate overlaps, or None if it violates
+        # one of the limits
+        x0, y0, x1, y1 = box
+        area = (x1 - x0) * (y1 - y0)
+        candidates = set()
+        for cell in self.cells(box):
+            candidates.update(self.grid.get(cell, ()))
+        overlaps = []
+        for i in candidates:
+            bx0, by0, bx1, by1 = self.boxes[i]
+            intersection = max(0, min(x1, bx1) - max(x0, bx0)) * max(0, min(y1, by1) - max(y0, by0))
+            if intersection == 0:
+                continue
+            box_area = (bx1 - bx0) * (by1 - by0)
+            if intersection / (area + box_area - intersection) > self.max_iou:
+                return None
+            if (self.covered[i] + intersection) / box_area > self.max_occlusion:
+                return None
+            overlaps.append((i, intersection))
+        return overlaps
+
+    def add(self, box: tuple, overlaps: list):
+        for i, intersection in overlaps:
+            self.covered[i] += intersection
+        for cell in self.cells(box):
+            self.grid.setdefault(cell, []).append(len(self.boxes))
+        self.boxes.append(box)
+        self.covered.append(0)
+
+    def place(self, width: int, height: int) -> tuple:
+        # returns the top left corner for an object of the given size, or None if it could not be placed
+        width = min(width, self.width)
+        height = min(height, self.height)
+        if not self.constrained():
+            # without limits the first position is taken and nothing needs to be indexed
+            return random.randint(0, self.width - width), random.randint(0, self.height - height)
+        for _ in range(self.attempts):
+            x = random.randint(0, self.width - width)
+            y = random.randint(0, self.height - height)
+            box = (x, y, x + width, y + height)
+            overlaps = self.overlaps(box)
+            if overlaps is not None:
+                self.add(box, overlaps)
+                return x, y
+        return None
@@ -0,0 +1,60 @@
+import queue
+import threading
+
+'''
+This class runs an iterator on a background thread and buffers up to buffer_size of its items in a bounded queue,
+so that the consumer gets the next item while the following ones are already being produced.
+Exceptions raised by the iterator are raised again on the consumer side.
+'''
+
+
+class Prefetcher:
+
+    # marks the end of the iterator in the buffer
+    DONE = object()
+
+    def __init__(self, iterator, buffer_size: int):
+        self.iterator = iterator
+        self.buffer = queue.Queue(buffer_size)
+        self.stopped = threading.Event()
+        self.error = None
+        self.finished = False
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def put(self, item) -> bool:
+        # waits for free space in the buffer, but gives up once the consumer has stopped
+        while not self.stopped.is_set():
+            try:
+                self.buffer.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def run(self):
+        try:
+            for item in self.iterator:
+                if not self.put(item):
+                    return
+        except Exception as exc:
+            self.error = exc
+        self.put(Prefetcher.DONE)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self.finished:
+            raise StopIteration
+        item = self.buffer.get()
+        if item is Prefetcher.DONE:
+            self.finished = True
+            if self.error is not None:
+                raise self.error
+            raise StopIteration
+        return item
+
+    def close(self):
+        self.stopped.set()
+        self.thread.join()
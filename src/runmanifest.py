@@ -0,0 +1,93 @@
+import json
+import os
+import threading
+import numpy as np
+
+'''
+This class records every generated sample of a run in a JSON lines manifest, written incrementally as the samples
+are written, so that an interrupted run can be resumed and a finished one extended to more images.
+The first line holds the settings of the run, every further line the index, seed, output paths and checksum of
+one sample. A sample that was generated again, e.g. by a resumed run, is recorded again and the later line counts.
+'''
+
+
+def sample_seed(seed: int, index: int) -> int:
+    # each sample only depends on (seed, index), not on which worker generates it or what was generated before
+    return int(np.random.SeedSequence([seed, index]).generate_state(1)[0])
+
+
+class RunManifest:
+
+    def __init__(self, path: str):
+        self.path = path
+        self.seed = None
+        self.lock = None
+        self.fd = None
+
+    @staticmethod
+    def node_path(path: str, shard_index: int, num_shards: int) -> str:
+        # every node of a run split across machines keeps its own manifest until they are merged
+        return path if num_shards == 1 else f'{path}.node-{shard_index:05d}-of-{num_shards:05d}'
+
+    def start(self, header: dict):
+        # a new run replaces the records of earlier runs
+        self.seed = header['seed']
+        with open(self.path, 'w') as outfile:
+            outfile.write(json.dumps(header) + '\n')
+
+    def write(self, header: dict, records: list):
+        with open(self.path + '.tmp', 'w') as outfile:
+            outfile.write(json.dumps(header) + '\n')
+            for record in records:
+                outfile.write(json.dumps(record) + '\n')
+        os.replace(self.path + '.tmp', self.path)
+
+    def compact(self):
+        # keeps only the latest record of every index, sorted by index, so that the manifest of a run does not
+        # depend on the order the samples were written in
+        header, records = self.load()
+        if header is not None:
+            self.write(header, [records[index] for index in sorted(records)])
+
+    def load(self) -> tuple:
+        # returns the header and the latest record of every index, a missing manifest has neither
+        if not os.path.isfile(self.path):
+            return None, {}
+        header = None
+        records = {}
+        with open(self.path, 'r') as f:
+            for line in f:
+                # the last line may be cut off if the run was killed while writing it
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                if header is None:
+                    header = record
+                else:
+                    records[record['index']] = record
+        if header is not None:
+            self.seed = header['seed']
+        return header, records
+
+    def open(self):
+        # opened per run like the writer, every worker process appends to the same file with single writes
+        self.lock = threading.Lock()
+        self.fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT)
+
+    def record(self, index: int, paths: list, checksum: str):
+        line = json.dumps({'index': index, 'seed': sample_seed(self.seed, index), 'paths': paths,
+                           'checksum': checksum}) + '\n'
+        with self.lock:
+            os.write(self.fd, line.encode('utf-8'))
+
+    def close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+        self.fd = None
+        self.lock = None
+
+    @staticmethod
+    def complete(record: dict) -> bool:
+        # a sample counts as generated as long as all of its files still exist
+        return all(os.path.isfile(path) for path in record['paths'])
@@ -0,0 +1,146 @@
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+import cv2
+import numpy as np
+from spritepyramid import SpritePyramid
+
+'''
+This class packs the decoded sources of a catalog into one file on disk, so that worker processes can share them.
+Backgrounds are stored as decoded BGR images, decoded with the same reduction a run would use for them, and objects as the levels of their sprite pyramids, one after another
+in a raw uint8 file, with a JSON index holding the offset and shape of every array. The data file is memory mapped
+read-only, so images are NumPy views into the page cache, which all processes share instead of each decoding and
+keeping its own copy.
+Every entry records the size and modification time of its source file, entries of changed sources are ignored.
+'''
+
+# arrays start at multiples of this, so that views are aligned for vectorized access
+ALIGNMENT = 64
+# files decoded at a time while preparing, bounds the memory used by the prepare step
+PREPARE_CHUNK = 64
+
+
+class SourceArena:
+
+    def __init__(self, data: np.ndarray, images: dict, sprites: dict, path: str = None):
+        self.data = data
+        self.images = images
+        self.sprites = sprites
+        self.path = path
+
+    def __getstate__(self) -> dict:
+        # worker processes started by spawn map the data file again instead of getting a pickled copy of it
+        state = dict(self.__dict__)
+        if self.path is not None:
+            state['data'] = None
+        return state
+
+    def __setstate__(self, state: dict):
+        self.__dict__.update(state)
+        if self.data is None:
+            self.data = SourceArena.map(self.path)
+
+    @staticmethod
+    def data_path(path: str) -> str:
+        return path + '.bin'
+
+    @staticmethod
+    def index_path(path: str) -> str:
+        return path + '.json'
+
+    @staticmethod
+    def exists(path: str) -> bool:
+        return os.path.isfile(SourceArena.data_path(path)) and os.path.isfile(SourceArena.index_path(path))
+
+    @staticmethod
+    def stamp(path: str) -> list:
+        stat = os.stat(path)
+        return [stat.st_size, stat.st_mtime_ns]
+
+    @staticmethod
+    def decode_background(path: str, flags: int = cv2.IMREAD_COLOR) -> list:
+        image = cv2.imread(path, flags)
+        return [image] if image is not None else None
+
+    @staticmethod
+    def decode_sprite(path: str, flags: int = None) -> list:
+        pyramid = SpritePyramid.load(path)
+        return pyramid.levels if pyramid is not None else None
+
+    @staticmethod
+    def prepare(path: str, backgrounds: list, objects: list, workers: int = None, decode_flags=None):
+        # decodes all sources into a new arena, files that cannot be decoded are left out. decode_flags gives the
+        # imread flags of every background, so that it is stored at the reduced size a run decodes it at
+        entries = [(source, SourceArena.decode_background,
+                    decode_flags(source) if decode_flags is not None else cv2.IMREAD_COLOR) for source in backgrounds] + \
+                  [(source, SourceArena.decode_sprite, None) for source in objects]
+        images = {}
+        sprites = {}
+        offset = 0
+        with open(SourceArena.data_path(path), 'wb') as outfile, ThreadPoolExecutor(workers) as executor:
+            for start in range(0, len(entries), PREPARE_CHUNK):
+                chunk = entries[start:start + PREPARE_CHUNK]
+                for (source, decode, flags), arrays in zip(chunk, executor.map(lambda entry: entry[1](entry[0], entry[2]),
+                                                                                chunk)):
+                    if arrays is None:
+                        continue
+                    stored = []
+                    for array in arrays:
+                        padding = -offset % ALIGNMENT
+                        outfile.write(bytes(padding))
+                        offset += padding
+                        outfile.write(np.ascontiguousarray(array).tobytes())
+                        stored.append([offset, list(array.shape)])
+                        offset += array.nbytes
+                    entry = {'stamp': SourceArena.stamp(source), 'arrays': stored}
+                    if decode is SourceArena.decode_background:
+                        entry['flags'] = flags
+                        images[source] = entry
+                    else:
+                        sprites[source] = entry
+        with open(SourceArena.index_path(path), 'w') as outfile:
+            json.dump({'images': images, 'sprites': sprites}, outfile)
+        return SourceArena.open(path)
+
+    @staticmethod
+    def map(path: str) -> np.ndarray:
+        return np.memmap(SourceArena.data_path(path), dtype=np.uint8, mode='r') \
+            if os.path.getsize(SourceArena.data_path(path)) > 0 else np.zeros(0, dtype=np.uint8)
+
+    @staticmethod
+    def open(path: str):
+        with open(SourceArena.index_path(path), 'r') as f:
+            index = json.load(f)
+        data = SourceArena.map(path)
+        current = {}
+        for entries in (index['images'], index['sprites']):
+            for source, entry in entries.items():
+                current[source] = os.path.isfile(source) and SourceArena.stamp(source) == entry['stamp']
+        return SourceArena(data,
+                           {source: (entry.get('flags', cv2.IMREAD_COLOR), entry['arrays'])
+                            for source, entry in index['images'].items() if current[source]},
+                           {source: entry['arrays'] for source, entry in index['sprites'].items() if current[source]},
+                           path)
+
+    def view(self, offset: int, shape: list) -> np.ndarray:
+        return self.data[offset:offset + int(np.prod(shape))].reshape(shape)
+
+    def image(self, path: str, flags: int = cv2.IMREAD_COLOR) -> np.ndarray:
+        # read-only view of a background, None if it is not in the arena or was stored decoded with other flags
+        entry = self.images.get(path)
+        if entry is None or entry[0] != flags:
+            return None
+        return self.view(*entry[1][0])
+
+    def pyramid(self, path: str) -> SpritePyramid:
+        arrays = self.sprites.get(path)
+        if arrays is None:
+            return None
+        return SpritePyramid([self.view(offset, shape) for offset, shape in arrays])
+
+    def stats(self) -> dict:
+        return {
+            'images': len(self.images),
+            'sprites': len(self.sprites),
+            'bytes': len(self.data)
+        }
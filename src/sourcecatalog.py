@@ -0,0 +1,151 @@
+import json
+import os
+import random
+from generatorexception import InvalidGeneratorArgumentException
+from sourcevalidator import SourceValidator
+
+'''
+This class holds the lists of background and object files, so that drawing a source file does not have to list
+directories again. It is built once per run by scanning the source directories or loaded from a manifest file
+written by a previous run.
+'''
+
+
+class SourceCatalog:
+
+    def __init__(self, image_source: str, backgrounds: list, objects_source: str = None, objects: dict = None,
+                 class_weights: dict = None):
+        self.image_source = image_source
+        self.backgrounds = backgrounds
+        self.objects_source = objects_source
+        self.objects = objects if objects is not None else {}
+        self.classes = sorted(self.objects)
+        self.set_class_weights(class_weights)
+
+    @staticmethod
+    def list_files(dir: str) -> list:
+        # sorted, so that the same seed draws the same files independent of the file system's listing order
+        return sorted(os.listdir(dir))
+
+    @staticmethod
+    def scan(image_source: str, objects_source: str = None, class_weights: dict = None):
+        backgrounds = [os.path.join(image_source, file) for file in SourceCatalog.list_files(image_source)]
+        objects = {}
+        if objects_source is not None:
+            for label in SourceCatalog.list_files(objects_source):
+                class_dir = os.path.join(objects_source, label)
+                # files next to the class directories end up as empty classes, which the generator rejects
+                objects[label] = [os.path.join(class_dir, file) for file in SourceCatalog.list_files(class_dir)] \
+                    if os.path.isdir(class_dir) else []
+        return SourceCatalog(image_source, backgrounds, objects_source, objects, class_weights)
+
+    @staticmethod
+    def load(path: str, class_weights: dict = None):
+        with open(path, 'r') as f:
+            manifest = json.load(f)
+        image_source = manifest['image_source']
+        objects_source = manifest['objects_source']
+        backgrounds = [os.path.join(image_source, file) for file in manifest['backgrounds']]
+        objects = {label: [os.path.join(objects_source, label, file) for file in files]
+                   for label, files in manifest['objects'].items()}
+        return SourceCatalog(image_source, backgrounds, objects_source, objects, class_weights)
+
+    @staticmethod
+    def open(path: str, image_source: str, objects_source: str = None, class_weights: dict = None, save: bool = True):
+        # reuses the manifest if it was written for the same sources, otherwise the sources are scanned again and
+        # the manifest is written unless save is off
+        if path is not None and os.path.isfile(path):
+            catalog = SourceCatalog.load(path, class_weights)
+            if catalog.image_source == image_source and catalog.objects_source == objects_source:
+                return catalog
+        catalog = SourceCatalog.scan(image_source, objects_source, class_weights)
+        if path is not None and save:
+            catalog.save(path)
+        return catalog
+
+    def save(self, path: str):
+        manifest = {
+            'image_source': self.image_source,
+            'objects_source': self.objects_source,
+            'backgrounds': [os.path.basename(file) for file in self.backgrounds],
+            'objects': {label: [os.path.basename(file) for file in files] for label, files in self.objects.items()}
+        }
+        with open(path, 'w') as outfile:
+            json.dump(manifest, outfile)
+
+    @staticmethod
+    def parse_class_weights(weights: str) -> dict:
+        # format: "label:weight, label:weight, ..."
+        class_weights = {}
+        for entry in weights.split(','):
+            if entry.strip() == '':
+                continue
+            label, _, weight = entry.partition(':')
+            class_weights[label.strip()] = float(weight)
+        return class_weights
+
+    def set_class_weights(self, class_weights: dict):
+        self.class_weights = class_weights
+        self.alias_probs = None
+        self.alias = None
+        if not class_weights:
+            return
+        for label, weight in class_weights.items():
+            if label not in self.objects:
+                raise InvalidGeneratorArgumentException(f"Class weight given for unknown object class '{label}'.")
+            if weight < 0:
+                raise InvalidGeneratorArgumentException("Class weights must not be negative.")
+        weights = [class_weights.get(label, 1.0) for label in self.classes]
+        total = sum(weights)
+        if total <= 0:
+            raise InvalidGeneratorArgumentException("At least one class weight must be positive.")
+        # alias tables (Walker's method) allow drawing a weighted class in constant time
+        n = len(weights)
+        scaled = [weight * n / total for weight in weights]
+        self.alias_probs = [1.0] * n
+        self.alias = list(range(n))
+        small = [i for i, p in enumerate(scaled) if p < 1.0]
+        large = [i for i, p in enumerate(scaled) if p >= 1.0]
+        while small and large:
+            s = small.pop()
+            l = large.pop()
+            self.alias_probs[s] = scaled[s]
+            self.alias[s] = l
+            scaled[l] = scaled[l] + scaled[s] - 1.0
+            if scaled[l] < 1.0:
+                small.append(l)
+            else:
+                large.append(l)
+
+    def check_backgrounds(self, validator: SourceValidator):
+        if len(self.backgrounds) == 0:
+            raise InvalidGeneratorArgumentException("Source catalog does not contain any images.")
+        invalid = validator.invalid_images(self.backgrounds)
+        if len(invalid) != 0:
+            print("Invalid image file found: " + str(invalid[0]))
+            raise InvalidGeneratorArgumentException("Image directory must only contain images (jpeg, png, ...).")
+
+    def check_objects(self, validator: SourceValidator):
+        if len(self.classes) == 0:
+            raise InvalidGeneratorArgumentException("Source catalog does not contain any object classes.")
+        for label in self.classes:
+            if len(self.objects[label]) == 0:
+                raise InvalidGeneratorArgumentException("Found invalid or empty sub-directory in object source.")
+            invalid = validator.invalid_sprites(self.objects[label])
+            if len(invalid) != 0:
+                print("Invalid png file found: " + str(invalid[0]))
+                raise InvalidGeneratorArgumentException("Found invalid png image in object source sub-directory.")
+
+    def random_background(self) -> str:
+        return self.backgrounds[random.randint(0, len(self.backgrounds) - 1)]
+
+    def random_class(self) -> str:
+        idx = random.randint(0, len(self.classes) - 1)
+        if self.alias is not None and random.random() >= self.alias_probs[idx]:
+            idx = self.alias[idx]
+        return self.classes[idx]
+
+    def random_object(self) -> tuple:
+        label = self.random_class()
+        files = self.objects[label]
+        return files[random.randint(0, len(files) - 1)], label
@@ -0,0 +1,161 @@
+import json
+import os
+import struct
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+VALIDATION_MODES = ['fast', 'strict']
+
+'''
+This class checks that source files are images the generators can use.
+In fast mode only the file headers are read to find the format, size and channel count of an image, in strict mode
+every image is fully decoded. Results are cached by path, file size and modification time, so unchanged sources
+are not read again by later runs.
+'''
+
+
+class SourceValidator:
+
+    def __init__(self, mode: str = 'fast', cache_path: str = None, workers: int = None):
+        self.mode = mode
+        self.cache_path = cache_path
+        self.workers = workers
+        self.lock = threading.Lock()
+        self.results = {}
+        if cache_path is not None and os.path.isfile(cache_path):
+            with open(cache_path, 'r') as f:
+                self.results = json.load(f)
+
+    def __getstate__(self) -> dict:
+        state = dict(self.__dict__)
+        del state['lock']
+        return state
+
+    def __setstate__(self, state: dict):
+        self.__dict__.update(state)
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def read_png_header(f) -> tuple:
+        f.seek(8)
+        length, chunk_type = struct.unpack('>I4s', f.read(8))
+        if chunk_type != b'IHDR':
+            return None
+        width, height, _, color_type = struct.unpack('>IIBB', f.read(10))
+        # images with an alpha channel or a transparency chunk are decoded with 4 channels by OpenCV
+        has_alpha = color_type in (4, 6)
+        f.seek(8 + 8 + length + 4)
+        while not has_alpha:
+            header = f.read(8)
+            if len(header) < 8:
+                break
+            length, chunk_type = struct.unpack('>I4s', header)
+            if chunk_type == b'tRNS':
+                has_alpha = True
+            elif chunk_type in (b'IDAT', b'IEND'):
+                break
+            f.seek(length + 4, os.SEEK_CUR)
+        if has_alpha:
+            channels = 4
+        elif color_type == 0:
+            channels = 1
+        else:
+            channels = 3
+        return 'png', width, height, channels
+
+    @staticmethod
+    def read_jpeg_header(f) -> tuple:
+        f.seek(2)
+        while True:
+            marker = f.read(2)
+            if len(marker) < 2 or marker[0] != 0xFF:
+                return None
+            # standalone markers without a length field
+            if marker[1] == 0x01 or 0xD0 <= marker[1] <= 0xD7:
+                continue
+            length = struct.unpack('>H', f.read(2))[0]
+            # start of frame markers hold the image size and the number of components
+            if 0xC0 <= marker[1] <= 0xCF and marker[1] not in (0xC4, 0xC8, 0xCC):
+                _, height, width, channels = struct.unpack('>BHHB', f.read(6))
+                return 'jpeg', width, height, channels
+            f.seek(length - 2, os.SEEK_CUR)
+
+    @staticmethod
+    def read_header(path: str) -> tuple:
+        # returns (format, width, height, channels) or None if the format is not known
+        with open(path, 'rb') as f:
+            signature = f.read(8)
+            try:
+                if signature == b'\x89PNG\r\n\x1a\n':
+                    return SourceValidator.read_png_header(f)
+                if signature[:2] == b'\xff\xd8':
+                    return SourceValidator.read_jpeg_header(f)
+            except struct.error:
+                return None
+        return None
+
+    @staticmethod
+    def decode(path: str) -> tuple:
+        # only strict validation decodes images, so fast validation works without loading OpenCV
+        import cv2
+        image = cv2.imread(path, cv2.IMREAD_UNCHANGED)
+        # if the image is None it cannot be a valid image file (expected: numpy.ndarray)
+        if image is None:
+            return None
+        channels = 1 if image.ndim == 2 else image.shape[2]
+        return 'decoded', image.shape[1], image.shape[0], channels
+
+    def inspect(self, path: str) -> dict:
+        # directories and other non-regular files in a source directory are invalid sources
+        if not os.path.isfile(path):
+            return {'size': 0, 'mtime': 0, 'valid': False, 'format': None, 'width': 0, 'height': 0, 'channels': 0}
+        stat = os.stat(path)
+        with self.lock:
+            cached = self.results.get(path)
+        if cached is not None and cached['size'] == stat.st_size and cached['mtime'] == stat.st_mtime_ns \
+                and (self.mode == 'fast' or cached['format'] == 'decoded'):
+            return cached
+        info = None
+        if self.mode == 'fast':
+            info = SourceValidator.read_header(path)
+        # formats without a header parser (bmp, webp, tiff, ...) are checked by decoding them
+        if info is None:
+            info = SourceValidator.decode(path)
+        result = {
+            'size': stat.st_size,
+            'mtime': stat.st_mtime_ns,
+            'valid': info is not None,
+            'format': info[0] if info is not None else None,
+            'width': info[1] if info is not None else 0,
+            'height': info[2] if info is not None else 0,
+            'channels': info[3] if info is not None else 0
+        }
+        with self.lock:
+            self.results[path] = result
+        return result
+
+    def inspect_all(self, paths: list) -> list:
+        if len(paths) == 0:
+            return []
+        with ThreadPoolExecutor(self.workers) as executor:
+            return list(executor.map(self.inspect, paths))
+
+    def invalid_images(self, paths: list) -> list:
+        return [path for path, result in zip(paths, self.inspect_all(paths))
+                if not result['valid'] or result['width'] == 0 or result['height'] == 0]
+
+    def invalid_sprites(self, paths: list) -> list:
+        # sprites need an alpha channel to be pasted onto backgrounds
+        return [path for path, result in zip(paths, self.inspect_all(paths))
+                if not result['valid'] or result['channels'] != 4]
+
+    def info(self, path: str) -> dict:
+        with self.lock:
+            return self.results.get(path)
+
+    def save(self):
+        if self.cache_path is None:
+            return
+        with self.lock:
+            with open(self.cache_path, 'w') as outfile:
+                json.dump(self.results, outfile)
@@ -0,0 +1,53 @@
+import cv2
+import numpy as np
+
+'''
+This class holds an object sprite prepared for pasting. The sprite is cropped to the bounding box of its visible
+pixels once, so transparent margins are neither resized on every paste nor counted into the annotation box, and
+downscaled into a pyramid of levels, each half the size of the previous one, keeping the alpha channel.
+A paste resizes the smallest level that is still at least as large as the requested size.
+'''
+
+# levels are not downscaled further once their longer side would drop below this size
+MIN_LEVEL_SIZE = 32
+
+
+class SpritePyramid:
+
+    def __init__(self, levels: list):
+        self.levels = levels
+        self.nbytes = sum(level.nbytes for level in levels)
+        self.shape = levels[0].shape
+
+    @staticmethod
+    def crop(sprite: np.ndarray) -> np.ndarray:
+        # fully transparent sprites are kept as they are
+        rows = np.flatnonzero(sprite[:, :, 3].any(axis=1))
+        columns = np.flatnonzero(sprite[:, :, 3].any(axis=0))
+        if len(rows) == 0:
+            return sprite
+        return sprite[rows[0]:rows[-1] + 1, columns[0]:columns[-1] + 1]
+
+    @staticmethod
+    def build(sprite: np.ndarray):
+        if sprite is None:
+            return None
+        levels = [np.ascontiguousarray(SpritePyramid.crop(sprite))]
+        while max(levels[-1].shape[:2]) // 2 >= MIN_LEVEL_SIZE:
+            height, width = levels[-1].shape[:2]
+            levels.append(cv2.resize(levels[-1], (width // 2, height // 2), interpolation=cv2.INTER_AREA))
+        for level in levels:
+            level.flags.writeable = False
+        return SpritePyramid(levels)
+
+    @staticmethod
+    def load(path: str):
+        return SpritePyramid.build(cv2.imread(path, cv2.IMREAD_UNCHANGED))
+
+    def resize(self, width: int, height: int) -> np.ndarray:
+        level = self.levels[0]
+        for candidate in self.levels[1:]:
+            if candidate.shape[1] < width or candidate.shape[0] < height:
+                break
+            level = candidate
+        return cv2.resize(level, (width, height))
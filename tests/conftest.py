@@ -0,0 +1,94 @@
+import configparser
+import hashlib
+import os
+import subprocess
+import sys
+import cv2
+import numpy as np
+import pytest
+
+# the modules of the project are flat files in src, imported the same way generate.py imports them
+SRC = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src')
+sys.path.insert(0, SRC)
+
+
+@pytest.fixture
+def sources(tmp_path) -> dict:
+    # small synthetic backgrounds and sprites, so that the runs of the tests take seconds
+    rng = np.random.default_rng(0)
+    backgrounds = tmp_path / 'backgrounds'
+    backgrounds.mkdir()
+    for i, (width, height) in enumerate([(320, 240), (400, 300), (1200, 900)]):
+        cv2.imwrite(str(backgrounds / f'background-{i}.jpg'), rng.integers(0, 256, (height, width, 3), dtype=np.uint8))
+    objects = tmp_path / 'objects'
+    for label in ['cats', 'dogs']:
+        (objects / label).mkdir(parents=True)
+        for i in range(3):
+            sprite = rng.integers(0, 256, (40 + 10 * i, 50 + 5 * i, 4), dtype=np.uint8)
+            sprite[:, :, 3] = rng.choice([0, 255], sprite.shape[:2])
+            cv2.imwrite(str(objects / label / f'{label}-{i}.png'), sprite)
+    return {'backgrounds': str(backgrounds), 'objects': str(objects), 'root': tmp_path}
+
+
+def write_config(sources: dict, name: str, **options) -> str:
+    # detection config with a resize section, so that every image has the same size, options override the generator
+    # keys, a value of None removes the key. The generators join output directories and file names without a
+    # separator, like the paths of the example configs the directories end with one
+    root = sources['root'] / name
+    (root / 'images').mkdir(parents=True)
+    (root / 'annotations').mkdir()
+    config = configparser.ConfigParser()
+    config['generator'] = {
+        'type': 'detection',
+        'img_source': sources['backgrounds'],
+        'obj_source': sources['objects'],
+        'annotation_format': 'json',
+        'annotation_output_dir': str(root / 'annotations') + os.sep,
+        'img_output_dir': str(root / 'images') + os.sep,
+        'img_num': '24',
+        'max_obj': '4',
+        'seed': '7',
+        'progress_interval': '0'
+    }
+    for key, value in options.items():
+        if value is None:
+            config.remove_option('generator', key)
+        else:
+            config['generator'][key] = str(value)
+    config['resize'] = {'width': '128', 'height': '96'}
+    config['flip'] = {'prob': '0.5', 'type': '1'}
+    config['random_object_erase'] = {'prob': '0.5', 'max_erase': '0.3'}
+    path = str(root / 'config.ini')
+    with open(path, 'w') as f:
+        config.write(f)
+    return path
+
+
+def run_generate(config: str, *args: str) -> str:
+    result = subprocess.run([sys.executable, 'generate.py', '-c', config, *args], cwd=SRC, capture_output=True,
+                            text=True, timeout=300)
+    # generate.py reports errors on stdout instead of failing
+    assert result.returncode == 0, result.stderr
+    assert 'An error occurred' not in result.stdout, result.stdout
+    return result.stdout
+
+
+def digest(*dirs: str) -> dict:
+    # sha256 of every file below the directories by its path relative to its directory
+    digests = {}
+    for directory in dirs:
+        for root, _, files in os.walk(directory):
+            for name in files:
+                path = os.path.join(root, name)
+                with open(path, 'rb') as f:
+                    digests[os.path.relpath(path, directory)] = hashlib.sha256(f.read()).hexdigest()
+    return digests
+
+
+def run_output(sources: dict, name: str) -> tuple:
+    # the generated files and the manifest of a run, with the paths of the run made relative to compare runs in
+    # different directories
+    root = sources['root'] / name
+    with open(root / 'manifest.jsonl') as f:
+        manifest = f.read().replace(str(root), '')
+    return digest(str(root / 'images'), str(root / 'annotations')), manifest
@@ -0,0 +1,99 @@
+import random
+import cv2
+import numpy as np
+from affineaugmentations import AffineAugmentations
+from augmentations import Augmentations, BoxAugmentations
+from generators import DetectionGenerator
+
+
+def smooth_image(height: int, width: int) -> np.ndarray:
+    # blurred noise, so that resampling once or several times only differs by little
+    noise = np.random.default_rng(0).integers(0, 256, (height, width, 3), dtype=np.uint8)
+    return cv2.GaussianBlur(noise, (0, 0), 8)
+
+
+def rectangle_image(box: dict, height: int = 120, width: int = 160) -> np.ndarray:
+    image = np.zeros((height, width, 3), dtype=np.uint8)
+    image[box['y0']:box['y1'], box['x0']:box['x1']] = 255
+    return image
+
+
+def pixel_box(image: np.ndarray) -> dict:
+    # box enclosing the pixels of the warped rectangle, None if none of them is left in the image
+    ys, xs = np.nonzero(image[:, :, 0] > 127)
+    if len(xs) == 0:
+        return None
+    return {'x0': xs.min(), 'y0': ys.min(), 'x1': xs.max() + 1, 'y1': ys.max() + 1}
+
+
+def assert_boxes_close(box: dict, expected: dict, tolerance: int):
+    for key in ['x0', 'y0', 'x1', 'y1']:
+        assert abs(box[key] - expected[key]) <= tolerance, (box, expected)
+
+
+def test_fused_steps_match_single_augmentations():
+    steps = [('resize', AffineAugmentations.resize, Augmentations.resize, {'width': 200, 'height': 150}),
+             ('crop', AffineAugmentations.crop, Augmentations.crop, {'prob': 1.0, 'min_crop': 0.6}),
+             ('flip', AffineAugmentations.flip, Augmentations.flip, {'prob': 1.0, 'type': 1})]
+    image = smooth_image(240, 320)
+    for seed in range(5):
+        random.seed(seed)
+        expected = image.copy()
+        for _, _, augmentation, args in steps:
+            expected = augmentation(expected, args)
+        random.seed(seed)
+        fused = AffineAugmentations.apply(image.copy(), {'steps': [(step, args) for _, step, _, args in steps]})
+        assert fused.shape == expected.shape == (150, 200, 3)
+        difference = np.abs(fused.astype(np.int16) - expected.astype(np.int16))
+        assert difference.mean() < 0.5 and difference.max() <= 3, seed
+
+
+def test_single_flip_is_exact():
+    image = smooth_image(60, 80)
+    for flip_type in [0, 1]:
+        args = {'prob': 1.0, 'type': flip_type}
+        fused = AffineAugmentations.apply(image.copy(), {'steps': [(AffineAugmentations.flip, args)]})
+        np.testing.assert_array_equal(fused, cv2.flip(image, flip_type))
+
+
+def test_rotated_boxes_enclose_warped_pixels():
+    box = {'x0': 40, 'y0': 30, 'x1': 100, 'y1': 70}
+    for degree in [15, 45, 90, 160]:
+        random.seed(0)
+        image, boxes = BoxAugmentations.rotate(rectangle_image(box), [box],
+                                               {'prob': 1.0, 'min_degree': degree, 'max_degree': degree})
+        assert_boxes_close(boxes[0], pixel_box(image), 2)
+
+
+def test_cropped_boxes_enclose_warped_pixels():
+    box = {'x0': 50, 'y0': 40, 'x1': 110, 'y1': 80}
+    for seed in range(10):
+        random.seed(seed)
+        image, boxes = BoxAugmentations.crop(rectangle_image(box), [box], {'prob': 1.0, 'min_crop': 0.5})
+        expected = pixel_box(image)
+        if expected is not None:
+            assert_boxes_close(boxes[0], expected, 2)
+
+
+def test_boxes_pushed_outside_are_dropped():
+    # a small object in the corner is cropped or rotated out of the image for some of the seeds
+    corner = {'x0': 0, 'y0': 0, 'x1': 12, 'y1': 10}
+    center = {'x0': 70, 'y0': 50, 'x1': 90, 'y1': 70}
+    dropped = 0
+    for seed in range(40):
+        random.seed(seed)
+        image = rectangle_image(corner)
+        if seed % 2 == 0:
+            image, boxes = BoxAugmentations.crop(image, [corner, center], {'prob': 1.0, 'min_crop': 0.4})
+        else:
+            image, boxes = BoxAugmentations.rotate(image, [corner, center], {'prob': 1.0, 'min_degree': 30,
+                                                                            'max_degree': 60})
+        sample = DetectionGenerator.drop_empty_boxes({'image': image, 'boxes': boxes, 'labels': ['corner', 'center']})
+        # the box of the center object always stays, the corner box only as long as its pixels are in the image
+        assert sample['labels'][-1] == 'center'
+        if 'corner' not in sample['labels']:
+            dropped += 1
+            assert pixel_box(image) is None
+        for kept in sample['boxes']:
+            assert 0 <= kept['x0'] < kept['x1'] <= 160 and 0 <= kept['y0'] < kept['y1'] <= 120
+    assert dropped > 0
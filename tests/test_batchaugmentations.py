@@ -0,0 +1,24 @@
+import numpy as np
+import pytest
+from batchaugmentations import BatchAugmentations
+
+
+def test_hsv_shift_without_shift_keeps_images():
+    images = np.random.default_rng(0).integers(0, 256, (4, 20, 30, 3), dtype=np.uint8)
+    result, _ = BatchAugmentations.hsv_shift(images.copy(), None, {'prob': 1.0, 'hue': 0, 'saturation': 0, 'value': 0})
+    np.testing.assert_array_equal(result, images)
+
+
+def test_hsv_shift_matches_albumentations():
+    functional = pytest.importorskip('albumentations.augmentations.functional')
+    images = np.random.default_rng(1).integers(0, 256, (5, 20, 30, 3), dtype=np.uint8)
+    args = {'prob': 1.0, 'hue': 10, 'saturation': 20, 'value': 30}
+    np.random.seed(3)
+    result, _ = BatchAugmentations.hsv_shift(images.copy(), None, args)
+    # the same draws as the batch: the selection, then the shifts of every channel
+    np.random.seed(3)
+    np.random.uniform(0, 1, len(images))
+    shifts = np.rint([np.random.uniform(-args[key], args[key], len(images)) for key in ['hue', 'saturation', 'value']])
+    for i, image in enumerate(images):
+        expected = functional.shift_hsv(image, int(shifts[0, i]), int(shifts[1, i]), int(shifts[2, i]))
+        np.testing.assert_array_equal(result[i], expected)
@@ -0,0 +1,41 @@
+import numpy as np
+from augmentations import BoxAugmentations
+
+
+def overlay_loop(image: np.ndarray, obj: np.ndarray, x: int, y: int) -> np.ndarray:
+    # the per-pixel paste the vectorised compositing replaced
+    for i in range(obj.shape[0]):
+        for j in range(obj.shape[1]):
+            if obj[i][j][3] != 0:
+                image[y + i][x + j][0] = obj[i][j][0]
+                image[y + i][x + j][1] = obj[i][j][1]
+                image[y + i][x + j][2] = obj[i][j][2]
+    return image
+
+
+def random_sprite(rng: np.random.Generator, height: int, width: int) -> np.ndarray:
+    sprite = rng.integers(0, 256, (height, width, 4), dtype=np.uint8)
+    # a mix of fully transparent, partly transparent and opaque pixels
+    sprite[:, :, 3] = rng.choice([0, 0, 40, 255], (height, width))
+    return sprite
+
+
+def test_mask_matches_loop():
+    rng = np.random.default_rng(1)
+    for height, width, x, y in [(17, 23, 0, 0), (30, 12, 5, 9), (40, 40, 60, 10), (1, 1, 99, 79)]:
+        background = rng.integers(0, 256, (80, 100, 3), dtype=np.uint8)
+        sprite = random_sprite(rng, height, width)
+        expected = overlay_loop(background.copy(), sprite, x, y)
+        result = BoxAugmentations.blend_object(background.copy(), sprite, x, y, 'mask', 0)
+        np.testing.assert_array_equal(result, expected)
+
+
+def test_alpha_of_opaque_sprite_matches_loop():
+    rng = np.random.default_rng(2)
+    background = rng.integers(0, 256, (64, 64, 3), dtype=np.uint8)
+    sprite = random_sprite(rng, 20, 30)
+    sprite[:, :, 3] = np.where(sprite[:, :, 3] != 0, 255, 0)
+    expected = overlay_loop(background.copy(), sprite, 7, 11)
+    result = BoxAugmentations.blend_object(background.copy(), sprite, 7, 11, 'alpha', 0)
+    np.testing.assert_array_equal(result, expected)
+
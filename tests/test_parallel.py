@@ -0,0 +1,15 @@
+import pytest
+from conftest import write_config, run_generate, digest
+
+
+@pytest.mark.parametrize('batch_size', [1, 4])
+def test_workers_produce_same_dataset(sources, batch_size):
+    # every image only depends on the seed and its index, not on the process that generated it
+    single = write_config(sources, 'single', workers=1, batch_size=batch_size)
+    parallel = write_config(sources, 'parallel', workers=3, batch_size=batch_size)
+    run_generate(single)
+    run_generate(parallel)
+    root = sources['root']
+    expected = digest(str(root / 'single' / 'images'), str(root / 'single' / 'annotations'))
+    assert len(expected) == 2 * 24
+    assert digest(str(root / 'parallel' / 'images'), str(root / 'parallel' / 'annotations')) == expected
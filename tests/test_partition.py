@@ -0,0 +1,38 @@
+import subprocess
+import sys
+import pytest
+from conftest import SRC, write_config, run_generate, run_output
+
+
+@pytest.mark.parametrize('options', [{'annotation_format': 'coco'},
+                                     {'annotation_format': 'jsonl', 'output': 'shards', 'shard_size': 5}])
+def test_merged_nodes_match_single_run(sources, options):
+    single = write_config(sources, 'single', manifest=sources['root'] / 'single' / 'manifest.jsonl', **options)
+    run_generate(single)
+    split = write_config(sources, 'split', manifest=sources['root'] / 'split' / 'manifest.jsonl', **options)
+    for shard_index in range(3):
+        run_generate(split, '--num-shards', '3', '--shard-index', str(shard_index))
+    run_generate(split, '--num-shards', '3', '--merge')
+    assert run_output(sources, 'split') == run_output(sources, 'single')
+
+
+def test_merge_refuses_missing_node(sources):
+    split = write_config(sources, 'split', manifest=sources['root'] / 'split' / 'manifest.jsonl',
+                         annotation_format='coco')
+    for shard_index in [0, 2]:
+        run_generate(split, '--num-shards', '3', '--shard-index', str(shard_index))
+    result = subprocess.run([sys.executable, 'generate.py', '-c', split, '--num-shards', '3', '--merge'], cwd=SRC,
+                            capture_output=True, text=True, timeout=300)
+    assert 'No manifest of shard 1 found' in result.stdout, result.stdout + result.stderr
+
+
+def test_merge_refuses_single_shard(sources):
+    # merging a run that was not split must leave its manifest and records alone
+    run = write_config(sources, 'run', manifest=sources['root'] / 'run' / 'manifest.jsonl', annotation_format='jsonl')
+    run_generate(run)
+    expected = run_output(sources, 'run')
+    for num_shards in ['1', '0']:
+        result = subprocess.run([sys.executable, 'generate.py', '-c', run, '--num-shards', num_shards, '--merge'],
+                                cwd=SRC, capture_output=True, text=True, timeout=300)
+        assert 'Merging requires the number of shards' in result.stdout, result.stdout + result.stderr
+    assert run_output(sources, 'run') == expected
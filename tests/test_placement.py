@@ -0,0 +1,48 @@
+import random
+import numpy as np
+import pytest
+from placement import PlacementEngine
+
+
+def iou(a: tuple, b: tuple) -> float:
+    intersection = max(0, min(a[2], b[2]) - max(a[0], b[0])) * max(0, min(a[3], b[3]) - max(a[1], b[1]))
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - intersection
+    return intersection / union
+
+
+@pytest.mark.parametrize('max_iou, max_occlusion, cell_size', [(0.3, 0.5, None), (0.1, 0.2, 7), (0.5, 0.25, 1000)])
+def test_placed_boxes_keep_limits(max_iou, max_occlusion, cell_size):
+    random.seed(0)
+    width, height = 320, 240
+    engine = PlacementEngine(width, height, max_iou, max_occlusion, attempts=30, cell_size=cell_size)
+    boxes = []
+    for _ in range(300):
+        # some objects are larger than the background and are clamped to it
+        object_width, object_height = random.randint(5, 400), random.randint(5, 300)
+        position = engine.place(object_width, object_height)
+        if position is None:
+            continue
+        x, y = position
+        box = (x, y, x + min(object_width, width), y + min(object_height, height))
+        assert 0 <= box[0] < box[2] <= width and 0 <= box[1] < box[3] <= height
+        boxes.append(box)
+    assert len(boxes) > 10
+    assert engine.boxes == boxes
+    for i, box in enumerate(boxes):
+        for other in boxes[i + 1:]:
+            assert iou(box, other) <= max_iou
+        # the share of the box hidden by all objects pasted on top of it
+        hidden = np.zeros((height, width), dtype=bool)
+        for other in boxes[i + 1:]:
+            hidden[other[1]:other[3], other[0]:other[2]] = True
+        area = (box[2] - box[0]) * (box[3] - box[1])
+        assert hidden[box[1]:box[3], box[0]:box[2]].sum() / area <= max_occlusion
+
+
+def test_unconstrained_placement_is_clamped():
+    random.seed(1)
+    engine = PlacementEngine(100, 80)
+    for _ in range(200):
+        object_width, object_height = random.randint(1, 150), random.randint(1, 120)
+        x, y = engine.place(object_width, object_height)
+        assert 0 <= x and x + min(object_width, 100) <= 100 and 0 <= y and y + min(object_height, 80) <= 80
@@ -0,0 +1,47 @@
+import os
+import signal
+import subprocess
+import sys
+import time
+from conftest import SRC, write_config, run_generate, run_output
+
+RESUME_OPTIONS = {'annotation_format': 'coco', 'img_num': 300, 'workers': 2, 'writer_threads': 2}
+
+
+def manifest_lines(path: str) -> int:
+    if not os.path.isfile(path):
+        return 0
+    with open(path) as f:
+        return sum(1 for _ in f)
+
+
+def test_resume_after_kill_matches_uninterrupted_run(sources):
+    full = write_config(sources, 'full', manifest=sources['root'] / 'full' / 'manifest.jsonl', **RESUME_OPTIONS)
+    run_generate(full)
+    manifest = sources['root'] / 'killed' / 'manifest.jsonl'
+    killed = write_config(sources, 'killed', manifest=manifest, **RESUME_OPTIONS)
+    # killed with its workers and writer threads in the middle of the run, like a node that lost power
+    process = subprocess.Popen([sys.executable, 'generate.py', '-c', killed], cwd=SRC, stdout=subprocess.DEVNULL,
+                               start_new_session=True)
+    deadline = time.time() + 120
+    while manifest_lines(str(manifest)) < 50 and process.poll() is None and time.time() < deadline:
+        time.sleep(0.01)
+    os.killpg(process.pid, signal.SIGKILL)
+    process.wait()
+    assert 1 < manifest_lines(str(manifest)) < 301, 'the run was not interrupted'
+    assert not os.path.isfile(sources['root'] / 'killed' / 'annotations' / 'annotations.json')
+    run_generate(killed, '--resume')
+    assert run_output(sources, 'killed') == run_output(sources, 'full')
+
+
+def test_resume_refuses_changed_config(sources):
+    options = dict(RESUME_OPTIONS, img_num=10, manifest=sources['root'] / 'run' / 'manifest.jsonl')
+    config = write_config(sources, 'run', **options)
+    run_generate(config)
+    with open(config) as f:
+        changed = f.read().replace('max_obj = 4', 'max_obj = 3')
+    with open(config, 'w') as f:
+        f.write(changed)
+    result = subprocess.run([sys.executable, 'generate.py', '-c', config, '--resume'], cwd=SRC, capture_output=True,
+                            text=True, timeout=300)
+    assert 'changed since the run to resume was started' in result.stdout, result.stdout + result.stderr
@@ -0,0 +1,49 @@
+import json
+import os
+import tarfile
+from conftest import write_config, run_generate, digest
+
+
+def test_shards_are_identical_across_runs_and_workers(sources):
+    # writer threads finish samples out of order, the shards still hold them in index order
+    runs = {'first': 1, 'second': 1, 'parallel': 3}
+    for name, workers in runs.items():
+        run_generate(write_config(sources, name, output='shards', shard_size=10, writer_threads=4, workers=workers))
+    root = sources['root']
+    expected = digest(str(root / 'first' / 'images'))
+    assert sorted(expected) == ['shard-000000.idx.json', 'shard-000000.tar', 'shard-000001.idx.json',
+                                'shard-000001.tar', 'shard-000002.idx.json', 'shard-000002.tar']
+    for name in runs:
+        assert digest(str(root / name / 'images')) == expected, name
+
+
+def test_shard_index_points_at_member_data(sources):
+    run_generate(write_config(sources, 'run', output='shards', shard_size=10, writer_threads=4))
+    images = sources['root'] / 'run' / 'images'
+    for shard in range(3):
+        with open(images / f'shard-{shard:06d}.idx.json') as f:
+            index = json.load(f)
+        tar_path = str(images / f'shard-{shard:06d}.tar')
+        with tarfile.open(tar_path) as tar, open(tar_path, 'rb') as raw:
+            members = tar.getmembers()
+            # members are stored in index order, every image followed by its annotation
+            assert [member.name for member in members] == [name for key in index for name in index[key]]
+            assert list(index) == [f'generated_{i}' for i in range(10 * shard, min(10 * shard + 10, 24))]
+            for member in members:
+                offset, size = index[os.path.splitext(member.name)[0]][member.name]
+                raw.seek(offset)
+                assert raw.read(size) == tar.extractfile(member).read()
+
+
+def test_shards_keep_streamed_records(sources):
+    # the records of streamed annotation formats are stored in the shards as well as in the records of the run
+    run_generate(write_config(sources, 'run', output='shards', shard_size=10, annotation_format='jsonl'))
+    root = sources['root'] / 'run'
+    with open(root / 'annotations' / 'annotations.jsonl') as f:
+        records = [json.loads(line) for line in f]
+    assert len(records) == 24
+    for record in records:
+        key = record['image_name'][0:record['image_name'].index('.')]
+        shard = int(key[len('generated_'):]) // 10
+        with tarfile.open(str(root / 'images' / f'shard-{shard:06d}.tar')) as tar:
+            assert json.loads(tar.extractfile(key + '.jsonl').read()) == record
@@ -0,0 +1,74 @@
+import shutil
+import subprocess
+import sys
+import cv2
+import numpy as np
+import pytest
+from conftest import SRC, write_config
+from sourcevalidator import SourceValidator
+
+
+@pytest.fixture
+def images(tmp_path) -> dict:
+    rng = np.random.default_rng(0)
+    paths = {}
+    for name, shape in [('color.jpg', (30, 40, 3)), ('gray.jpg', (25, 35)), ('color.png', (20, 10, 3)),
+                        ('sprite.png', (16, 24, 4)), ('gray.png', (12, 8))]:
+        paths[name] = str(tmp_path / name)
+        cv2.imwrite(paths[name], rng.integers(0, 256, shape, dtype=np.uint8))
+    paths['text.jpg'] = str(tmp_path / 'text.jpg')
+    with open(paths['text.jpg'], 'w') as f:
+        f.write('not an image')
+    paths['directory'] = str(tmp_path / 'directory')
+    (tmp_path / 'directory').mkdir()
+    # a jpeg cut off after its header, fast validation only reads the header
+    paths['truncated.jpg'] = str(tmp_path / 'truncated.jpg')
+    with open(paths['color.jpg'], 'rb') as f:
+        data = f.read()
+    with open(paths['truncated.jpg'], 'wb') as f:
+        f.write(data[:data.index(b'\xff\xda')])
+    return paths
+
+
+def test_fast_and_strict_agree(images):
+    fast = SourceValidator(mode='fast')
+    strict = SourceValidator(mode='strict')
+    for name in ['color.jpg', 'gray.jpg', 'color.png', 'sprite.png', 'gray.png', 'text.jpg', 'directory']:
+        expected = strict.inspect(images[name])
+        result = fast.inspect(images[name])
+        assert (result['valid'], result['width'], result['height'], result['channels']) == \
+               (expected['valid'], expected['width'], expected['height'], expected['channels']), name
+    assert fast.invalid_images([images['text.jpg'], images['directory'], images['color.jpg']]) == \
+           [images['text.jpg'], images['directory']]
+    assert fast.invalid_sprites([images['sprite.png'], images['color.png']]) == [images['color.png']]
+
+
+def test_truncated_image_only_fails_strict(images):
+    assert SourceValidator(mode='fast').invalid_images([images['truncated.jpg']]) == []
+    assert SourceValidator(mode='strict').invalid_images([images['truncated.jpg']]) == [images['truncated.jpg']]
+
+
+def test_run_reports_undecodable_source(sources, images):
+    # a source that passes fast validation but cannot be decoded stops the run with an error naming it
+    shutil.copy(images['truncated.jpg'], sources['backgrounds'])
+    for workers in [1, 2]:
+        config = write_config(sources, f'workers-{workers}', workers=workers, img_num=40)
+        result = subprocess.run([sys.executable, 'generate.py', '-c', config], cwd=SRC, capture_output=True,
+                                text=True, timeout=300)
+        assert 'An error occurred' in result.stdout and 'Could not decode source image' in result.stdout, \
+            result.stdout + result.stderr
+
+
+@pytest.mark.parametrize('key, message', [('img_source', 'Image source directory is not a directory or is empty.'),
+                                          ('obj_source', 'Object source directory not a real directory or is empty.')])
+def test_bad_source_directory_is_reported(sources, key, message):
+    not_a_directory = str(sources['root'] / 'file.txt')
+    with open(not_a_directory, 'w') as f:
+        f.write('not a directory')
+    for name, path in [('file', not_a_directory), ('missing', str(sources['root'] / 'missing'))]:
+        for args in [[], ['--dry-run']]:
+            config = write_config(sources, f'{name}{len(args)}', **{key: path})
+            result = subprocess.run([sys.executable, 'generate.py', '-c', config, *args], cwd=SRC,
+                                    capture_output=True, text=True, timeout=300)
+            assert f'An error occurred: InvalidGeneratorArgumentException – {message}' in result.stdout, \
+                result.stdout + result.stderr